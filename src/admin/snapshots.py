@@ -0,0 +1,96 @@
+import hashlib
+import hmac
+import json
+import time
+from typing import Callable
+
+from metrics.registry import REGISTRY
+
+ADMIN_READS = REGISTRY.counter(
+    'koinet_admin_reads_total', 'Admin read API requests by view and how they were answered', ('view', 'result'))
+
+def etagMatches(if_none_match: str | None, etag: str) -> bool:
+    """
+    Whether an If-None-Match header covers `etag` (weak comparison, as RFC 9110 asks for).
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+
+    opaque = etag.removeprefix('W/')
+    return any(candidate.strip().removeprefix('W/') == opaque for candidate in if_none_match.split(','))
+
+def authorized(token: str | None, authorization: str | None) -> bool:
+    """
+    Check an `Authorization: Bearer` header against the admin token. Without a token configured
+    nobody is let in: the portal is reachable from the internet through the tunnel.
+    """
+    if not token:
+        return False
+    scheme, _, supplied = (authorization or '').partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(supplied.strip().encode(), token.encode())
+
+class _View:
+    __slots__ = ('build', 'body', 'etag', 'builtAt')
+
+    def __init__(self, build: Callable[[], dict]):
+        self.build = build
+        self.body = None
+        self.etag = None
+        self.builtAt = None
+
+class SnapshotCache:
+    """
+    Read-only admin views of in-memory state, micro-cached and served with ETags.
+
+    Each view is rebuilt from its builder at most once per `ttl` seconds, however often it is
+    requested; in between a request is a dict lookup and a clock read. The ETag is a hash of the
+    encoded body, so it only changes when the content does and a client holding the current one
+    gets a 304 without a body.
+    """
+    def __init__(self, ttl: float = 1.0):
+        self._ttl = ttl
+        self._views: dict[str, _View] = {}
+
+        # Statistics
+        self.builds = 0
+
+    def add(self, name: str, build: Callable[[], dict]):
+        self._views[name] = _View(build)
+
+    def __contains__(self, name: str):
+        return name in self._views
+
+    @property
+    def names(self) -> list[str]:
+        return sorted(self._views)
+
+    def _current(self, view: _View, now: float) -> _View:
+        if view.builtAt is not None and now - view.builtAt < self._ttl:
+            return view
+
+        body = json.dumps(view.build(), separators=(',', ':'), default=str)
+        if body != view.body:
+            view.body = body
+            view.etag = '"' + hashlib.blake2b(body.encode(), digest_size=8).hexdigest() + '"'
+        view.builtAt = now
+        self.builds += 1
+        return view
+
+    def respond(self, name: str, if_none_match: str | None = None) -> tuple[int, str, str, dict]:
+        """
+        Answer a GET for view `name`: (status, body, media type, headers).
+        """
+        view = self._views.get(name)
+        if view is None:
+            return 404, '{"detail":"Not Found"}', 'application/json', {}
+
+        view = self._current(view, time.monotonic())
+        headers = {'ETag': view.etag, 'Cache-Control': f'private, max-age={max(int(self._ttl), 0)}'}
+        if etagMatches(if_none_match, view.etag):
+            ADMIN_READS.inc(name, 'not_modified')
+            return 304, '', 'application/json', headers
+
+        ADMIN_READS.inc(name, 'ok')
+        return 200, view.body, 'application/json', headers
@@ -1,16 +1,70 @@
 import asyncio
+import logging
+import threading
+import time
+from collections import deque
+
 import serial
-import time # For potential timing issues
+
+log = logging.getLogger(__name__)
+
+def parseFrame(line: str) -> tuple[float, float, int] | None:
+    """
+    Parses one 'voltage,current,coin_count' line from the Arduino. Returns None for malformed frames.
+    """
+    values = line.strip().split(',')
+    if len(values) < 3:
+        return None
+
+    try:
+        voltage, current, coin_count = float(values[0]), float(values[1]), int(values[2])
+    except ValueError:
+        return None
+
+    if coin_count < 0:
+        return None # A line glitch, the counter never goes below zero
+    return voltage, current, coin_count
 
 class ArduinoSerial:
-    def __init__(self, port, baud_rate=9600):
+    """
+    Coin acceptor and power sensor on a serial line.
+
+    A single long-lived reader thread owns the port. It frames incoming bytes into lines,
+    hands them to the event loop through a bounded buffer and reopens the port with
+    exponential backoff whenever the device drops (USB reset, cable pulled, ...).
+    `port` may be a device path or any pyserial URL, so a pty pair works for testing.
+    """
+    def __init__(self, port, baud_rate=9600, max_frame_length=128, max_pending_frames=64,
+                 min_backoff=0.5, max_backoff=30.0):
         self.port = port
         self.baud_rate = baud_rate
         self.ser = None
         self._coin_count = 0
         self.voltage = None # Initialize these as well
         self.current = None # Initialize these as well
-        self._reader_task = None # To hold the background reading task
+        self.lastFrameAt = None # time.monotonic() of the last valid frame
+
+        self._max_frame_length = max_frame_length
+        self._min_backoff = min_backoff
+        self._max_backoff = max_backoff
+
+        self._loop = None
+        self._reader_thread = None
+        self._stopping = threading.Event()
+
+        # Frames read by the thread but not yet handled on the event loop
+        self._frames = deque()
+        self._max_pending_frames = max_pending_frames
+        self._drainScheduled = False
+
+        # Line statistics
+        self.framesReceived = 0
+        self.droppedFrames = 0
+        self.malformedFrames = 0
+        self.reconnects = 0
+
+        # Replaced on every publish, so waiters wake exactly when new values arrive
+        self._changed = asyncio.Event()
 
     @property
     def coinCount(self):
@@ -20,97 +74,212 @@ class ArduinoSerial:
     def coinCount(self, value):
         if not isinstance(value, int) or value < 0:
             raise ValueError("Coin count must be a non-negative integer.")
-        self._coin_count = value
+        if value != self._coin_count:
+            self._coin_count = value
+            self._publish()
+
+    def _publish(self):
+        """
+        Wake everything waiting on waitForChange / waitForCoin / subscribe.
+        """
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def waitForChange(self, timeout: float | None = None) -> bool:
+        """
+        Wait for the next coin or telemetry update. Returns False if the timeout passed first.
+        """
+        changed = self._changed
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def waitForCoin(self, last_count: int, timeout: float | None = None) -> int:
+        """
+        Wait until the coin count differs from `last_count` and return the new count.
+        On timeout the unchanged count is returned.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+
+        while self._coin_count == last_count:
+            remaining = None if deadline is None else deadline - loop.time()
+            if remaining is not None and remaining <= 0:
+                break
+            if not await self.waitForChange(remaining):
+                break
+
+        return self._coin_count
+
+    async def subscribe(self):
+        """
+        Async iterator yielding (voltage, current, coin_count) every time the Arduino reports new values.
+        """
+        while True:
+            await self.waitForChange()
+            yield (self.voltage, self.current, self._coin_count)
     
     def resetCoinCount(self):
         """
-        Resets the internal coin count and sends a 'reset' command to Arduino.
+        Sends a 'reset' command to the Arduino. The new count arrives with its next frame.
         """
+        if self.ser is None:
+            log.warning("Cannot reset coin count on %s: serial port is not open.", self.port)
+            return
 
         # Get the current event loop
         loop = asyncio.get_running_loop()
 
         # Submit the blocking serial write operation to be run in a separate thread
         # This prevents blocking the asyncio event loop
-        asyncio.create_task(
-            loop.run_in_executor(
-                None, # Use the default thread pool
-                lambda: self.ser.write('reset\n'.encode('utf-8')) # Use lambda to pass args
-            )
+        ser = self.ser
+        future = loop.run_in_executor(
+            None, # Use the default thread pool
+            lambda: ser.write('reset\n'.encode('utf-8')) # Use lambda to pass args
         )
-        print("Submitted 'reset' command to serial port.")
+        future.add_done_callback(self._resetDone)
+        log.debug("Submitted 'reset' command to serial port %s.", self.port)
+
+    def _resetDone(self, future: asyncio.Future):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            log.warning("Failed to send 'reset' to %s: %s", self.port, error)
 
     async def startSerial(self):
-        print(f"Attempting to open serial port {self.port}...")
-        try:
-            # IMPORTANT: Initialize pyserial with a timeout.
-            # This ensures that even if readline is accidentally called in a blocking way,
-            # it won't wait forever, but will return after the timeout.
-            # However, the primary fix is run_in_executor for asynchronous reading.
-            self.ser = serial.Serial(self.port, self.baud_rate, timeout=0.1) # e.g., 0.1 seconds
-            print(f"Serial port {self.port} opened successfully.")
-            # Create the reader task and store it so it can be cancelled later
-            self._reader_task = asyncio.create_task(self._readRawSerial())
-        except serial.SerialException as e:
-            print(f"Error opening serial port {self.port}: {e}")
-            self.ser = None # Ensure ser is None if opening fails
+        """
+        Start the reader thread. The port itself is opened (and reopened) by that thread.
+        """
+        if self._reader_thread is not None and self._reader_thread.is_alive():
+            return
+
+        self._loop = asyncio.get_running_loop()
+        self._stopping.clear()
+        self._reader_thread = threading.Thread(
+            target=self._readerLoop,
+            name=f"serial-{self.port}",
+            daemon=True
+        )
+        self._reader_thread.start()
 
     async def stopSerial(self):
-        if self._reader_task:
-            print("Cancelling Arduino serial reader task...")
-            self._reader_task.cancel()
-            try:
-                await self._reader_task # Await until it's actually cancelled
-            except asyncio.CancelledError:
-                pass
-            print("Arduino serial reader task cancelled.")
+        if self._reader_thread is not None:
+            log.info("Stopping Arduino serial reader thread for %s...", self.port)
+            self._stopping.set()
+            await asyncio.get_running_loop().run_in_executor(None, self._reader_thread.join, 2)
+            self._reader_thread = None
+            log.info("Arduino serial reader thread for %s stopped.", self.port)
 
-        if self.ser and self.ser.is_open:
-            print(f"Closing serial port {self.port}...")
-            self.ser.close()
-            print(f"Serial port {self.port} closed.")
+        self._closePort()
 
+    # ──────────────────────────── reader thread ────────────────────────────
+    def _openPort(self) -> bool:
+        try:
+            # The read timeout bounds how long the thread takes to notice stopSerial()
+            self.ser = serial.serial_for_url(self.port, self.baud_rate, timeout=0.5)
+            log.info("Serial port %s opened successfully.", self.port)
+            return True
+        except (serial.SerialException, OSError, ValueError) as e:
+            log.warning("Error opening serial port %s: %s", self.port, e)
+            self.ser = None
+            return False
 
-    async def _readRawSerial(self):
-        loop = asyncio.get_running_loop()
-        print("Starting raw serial reader task...")
-        while True:
+    def _closePort(self):
+        ser, self.ser = self.ser, None
+        if ser is not None and ser.is_open:
+            log.info("Closing serial port %s...", self.port)
             try:
-                # Use loop.run_in_executor to run the blocking readline call in a separate thread.
-                # `None` means use the default ThreadPoolExecutor.
-                # We still check in_waiting first to avoid unnecessary executor calls if no data.
-                if self.ser and self.ser.is_open and self.ser.in_waiting > 0:
-                    read_data = await loop.run_in_executor(None, self.ser.readline)
-                    decoded_read = read_data.decode('utf-8').strip()
-                    # print(f"Serial raw value: {decoded_read}") # Uncomment for debugging
-
-                    values = decoded_read.split(',')
-                    # Ensure you have enough values to avoid IndexError
-                    if len(values) >= 3:
-                        try:
-                            self.voltage = float(values[0])
-                            self.current = float(values[1])
-                            self.coinCount = int(values[2])
-                            # else:
-                                # print(f"Received coin count {new_coin_count}, no change (current: {self._coin_count})")
-                        except ValueError as ve:
-                            print(f"Error parsing serial values: {ve} - Raw: '{decoded_read}'")
-                        except IndexError as ie:
-                            print(f"Not enough values in serial data: {ie} - Raw: '{decoded_read}'")
-                    else:
-                        print(f"Incomplete serial data received: '{decoded_read}'")
-
-                # Always yield control to the event loop, even if no data was read.
-                # This ensures other asyncio tasks get a chance to run.
-                await asyncio.sleep(0.01)
-
-            except serial.SerialException as e:
-                print(f"Serial communication error in _readRawSerial: {e}")
-                # Re-attempt connection or raise a more critical error if needed
-                break # Exit the loop on critical serial error
-            except asyncio.CancelledError:
-                print("Arduino serial reader task was cancelled.")
-                break # Essential to break out of the loop when cancelled
+                ser.close()
             except Exception as e:
-                print(f"An unexpected error occurred in _readRawSerial: {e}")
-                break # Catch any other unexpected errors and exit
\ No newline at end of file
+                log.warning("Failed to close serial port %s: %s", self.port, e)
+
+    def _readerLoop(self):
+        backoff = self._min_backoff
+        buffer = bytearray()
+
+        while not self._stopping.is_set():
+            if self.ser is None:
+                if not self._openPort():
+                    log.info("Retrying serial port %s in %.1fs", self.port, backoff)
+                    self._stopping.wait(backoff)
+                    backoff = min(backoff * 2, self._max_backoff)
+                    continue
+
+                backoff = self._min_backoff
+                buffer.clear()
+
+            try:
+                # Blocks until at least one byte arrives or the read timeout passes
+                chunk = self.ser.read(self.ser.in_waiting or 1)
+            except (serial.SerialException, OSError, TypeError) as e:
+                # pyserial raises TypeError from in_waiting when the port vanished underneath it
+                log.warning("Serial communication error on %s: %s", self.port, e)
+                self._closePort()
+                self.reconnects += 1
+                continue
+
+            if not chunk:
+                continue
+
+            buffer += chunk
+            while True:
+                newline = buffer.find(b'\n')
+                if newline < 0:
+                    break
+
+                frame = bytes(buffer[:newline])
+                del buffer[:newline + 1]
+                self._queueFrame(frame)
+
+            # No newline within a sane frame length means line noise or a baud rate mismatch
+            if len(buffer) > self._max_frame_length:
+                self.droppedFrames += 1
+                buffer.clear()
+
+        self._closePort()
+
+    def _queueFrame(self, frame: bytes):
+        if len(frame) > self._max_frame_length or len(self._frames) >= self._max_pending_frames:
+            self.droppedFrames += 1
+            return
+
+        self._frames.append(frame)
+
+        # Appended before checking, so a drain that already started still sees this frame
+        if not self._drainScheduled:
+            self._drainScheduled = True
+            self._loop.call_soon_threadsafe(self._drainFrames)
+
+    # ──────────────────────────── event loop side ────────────────────────────
+    def _drainFrames(self):
+        self._drainScheduled = False
+        while self._frames:
+            self._handleFrame(self._frames.popleft())
+
+    def _handleFrame(self, frame: bytes):
+        self.framesReceived += 1
+
+        decoded_read = frame.decode('utf-8', errors='replace').strip()
+        if not decoded_read:
+            return
+
+        values = parseFrame(decoded_read)
+        if values is None:
+            self.malformedFrames += 1
+            log.warning("Malformed serial data received on %s: %r", self.port, decoded_read)
+            return
+
+        voltage, current, coin_count = values
+        self.lastFrameAt = time.monotonic()
+
+        telemetry_changed = (voltage, current) != (self.voltage, self.current)
+        self.voltage = voltage
+        self.current = current
+
+        if coin_count != self._coin_count:
+            self.coinCount = coin_count # Publishes the new values as well
+        elif telemetry_changed:
+            self._publish()
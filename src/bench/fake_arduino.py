@@ -0,0 +1,93 @@
+import os
+import random
+import select
+import threading
+import tty
+
+class FakeArduino:
+    """
+    pty-backed stand-in for the coin acceptor / PLTS sensor Arduino.
+
+    `path` is the slave side of the pty and can be given to ArduinoSerial like a real port.
+    A thread writes one 'voltage,current,coin_count' line every 1/`rate` seconds, with some
+    noise on the readings, and answers the 'reset' command like the firmware does.
+    """
+    def __init__(self, rate: float = 2.0, voltage: float = 13.2, current: float = 1.5, noise: float = 0.05):
+        self.rate = rate
+        self.voltage = voltage
+        self.current = current
+        self.noise = noise
+
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._master)
+        tty.setraw(self._slave)
+        self.path = os.ttyname(self._slave)
+
+        self.coins = 0
+        self.resets = 0
+        self.linesWritten = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"fake-arduino-{self.path}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """Stop writing and close the pty, which looks like the device being unplugged. Idempotent."""
+        if self._stopping.is_set():
+            return
+        self._stopping.set()
+        self._wake.set()
+        if self._thread.is_alive():
+            self._thread.join(2)
+        os.close(self._master)
+        os.close(self._slave)
+
+    def insertCoin(self, count: int = 1):
+        """Drop coins; the new count goes out right away instead of on the next tick."""
+        with self._lock:
+            self.coins += count
+        self._wake.set()
+
+    def writeRaw(self, data: bytes):
+        """Inject arbitrary bytes, e.g. malformed frames."""
+        os.write(self._master, data)
+
+    def _line(self) -> bytes:
+        voltage = self.voltage * (1 + random.uniform(-self.noise, self.noise))
+        current = self.current * (1 + random.uniform(-self.noise, self.noise))
+        with self._lock:
+            coins = self.coins
+        return f'{voltage:.2f},{current:.3f},{coins}\n'.encode()
+
+    def _readCommands(self, buffer: bytearray) -> bytearray:
+        while select.select([self._master], [], [], 0)[0]:
+            try:
+                buffer += os.read(self._master, 256)
+            except OSError:
+                break
+
+        while b'\n' in buffer:
+            line, _, buffer = buffer.partition(b'\n')
+            if line.strip() == b'reset':
+                with self._lock:
+                    self.coins = 0
+                    self.resets += 1
+                self._wake.set()
+        return buffer
+
+    def _run(self):
+        buffer = bytearray()
+        interval = 1 / self.rate
+        while not self._stopping.is_set():
+            buffer = self._readCommands(buffer)
+            try:
+                os.write(self._master, self._line())
+                self.linesWritten += 1
+            except OSError:
+                return
+
+            self._wake.wait(interval)
+            self._wake.clear()
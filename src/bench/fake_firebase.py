@@ -0,0 +1,102 @@
+import copy
+import threading
+import time
+
+class FakeFirebase:
+    """
+    In-memory stand-in for the Realtime Database, implementing the parts of
+    firebase_admin.db.Reference the kiosk uses: get (incl. shallow), set, update with
+    multi-location paths and {'.sv': {'increment': n}} server values, and delete.
+    `latency` delays every call to mimic the uplink.
+    """
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.root: dict = {}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def install(self):
+        """
+        Point firebase_admin at this instance. Only for the benchmark process.
+        """
+        import firebase_admin
+        from firebase_admin import credentials, db
+
+        credentials.Certificate = lambda cert: None
+        firebase_admin.initialize_app = lambda *args, **kwargs: None
+        db.reference = self.reference
+
+    def reference(self, path: str = '/') -> '_Reference':
+        return _Reference(self, [part for part in path.strip('/').split('/') if part])
+
+    # ──────────────────────────── tree ────────────────────────────
+    def _call(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _get(self, parts: list[str]):
+        node = self.root
+        for part in parts:
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return node
+
+    def _set(self, parts: list[str], value):
+        if not parts:
+            self.root = value if isinstance(value, dict) else {}
+            return
+
+        node = self.root
+        trail = []
+        for part in parts[:-1]:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                child = node[part] = {}
+            trail.append((node, part))
+            node = child
+
+        if isinstance(value, dict) and isinstance(value.get('.sv'), dict):
+            current = node.get(parts[-1])
+            value = (current if isinstance(current, (int, float)) else 0) + value['.sv'].get('increment', 0)
+
+        if value is None:
+            node.pop(parts[-1], None)
+            # Firebase has no empty nodes
+            for parent, key in reversed(trail):
+                if parent[key]:
+                    break
+                del parent[key]
+        else:
+            node[parts[-1]] = copy.deepcopy(value)
+
+class _Reference:
+    def __init__(self, database: FakeFirebase, parts: list[str]):
+        self._db = database
+        self._parts = parts
+
+    def get(self, etag: bool = False, shallow: bool = False):
+        self._db._call()
+        with self._db._lock:
+            value = self._db._get(self._parts)
+            if shallow and isinstance(value, dict):
+                return {key: True for key in value}
+            return copy.deepcopy(value)
+
+    def set(self, value):
+        self._db._call()
+        with self._db._lock:
+            self._db._set(self._parts, value)
+
+    def update(self, value: dict):
+        self._db._call()
+        with self._db._lock:
+            for path, child in value.items():
+                self._db._set(self._parts + [part for part in path.strip('/').split('/') if part], child)
+
+    def delete(self):
+        self.set(None)
+
+    def child(self, path: str) -> '_Reference':
+        return _Reference(self._db, self._parts + [part for part in path.strip('/').split('/') if part])
@@ -0,0 +1,184 @@
+import asyncio
+import itertools
+import logging
+
+from mikrotik_comm.ros_stream import encodeSentence, readSentence
+
+log = logging.getLogger(__name__)
+
+# ──────────────────────────── router ────────────────────────────
+class FakeRouterOS:
+    """
+    Localhost stand-in for a RouterOS device speaking the binary API (plain, port 8728 style).
+
+    Holds /ip/hotspot/host, /ip/hotspot/user and /ip/hotspot/active tables in memory and
+    answers login, print (with ?queries and .proplist), add, remove, set, listen and /cancel.
+    `latency` delays every reply to mimic the router's CPU. Enough for the portal, not a
+    RouterOS emulator.
+    """
+    def __init__(self, hosts: int = 100, latency: float = 0.0):
+        self.latency = latency
+        self._ids = itertools.count(1)
+        self.tables: dict[str, list[dict]] = {
+            '/ip/hotspot/host': [],
+            '/ip/hotspot/user': [],
+            '/ip/hotspot/active': [],
+        }
+        self._listeners: dict[str, list[tuple[asyncio.StreamWriter, str]]] = {path: [] for path in self.tables}
+        for index in range(hosts):
+            mac, ip = self.client(index)
+            self.insert('/ip/hotspot/host', {
+                'mac-address': mac, 'address': ip, 'to-address': ip,
+                'authorized': 'false', 'bypassed': 'false',
+            })
+
+        self.requests = 0
+        self._server = None
+        self._connections: dict[asyncio.StreamWriter, asyncio.Task] = {}
+
+    @staticmethod
+    def client(index: int) -> tuple[str, str]:
+        """MAC and IP address of the index-th simulated client."""
+        return (f'02:00:00:00:{index >> 8 & 0xFF:02X}:{index & 0xFF:02X}',
+                f'10.5.{index >> 8 & 0xFF}.{index & 0xFF}')
+
+    # ──────────────────────────── tables ────────────────────────────
+    def insert(self, table: str, row: dict) -> str:
+        row_id = f'*{next(self._ids):X}'
+        row = {'.id': row_id, **row}
+        self.tables[table].append(row)
+        self._notify(table, row)
+        return row_id
+
+    def delete(self, table: str, targets: set[str]) -> int:
+        """Remove rows by .id or name, returns how many were removed."""
+        rows = self.tables[table]
+        removed = [row for row in rows if row['.id'] in targets or row.get('name') in targets]
+        rows[:] = [row for row in rows if row not in removed]
+        for row in removed:
+            self._notify(table, {'.id': row['.id'], '.dead': 'true'})
+        return len(removed)
+
+    def update(self, table: str, target: str, attributes: dict) -> bool:
+        for row in self.tables[table]:
+            if row['.id'] == target or row.get('name') == target:
+                row.update(attributes)
+                self._notify(table, row)
+                return True
+        return False
+
+    def _notify(self, table: str, row: dict):
+        words = ['!re', *(f'={key}={value}' for key, value in row.items())]
+        for writer, tag in self._listeners.get(table, ()):
+            writer.write(encodeSentence(words + [f'.tag={tag}']))
+
+    # ──────────────────────────── server ────────────────────────────
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> int:
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._connections):
+                writer.close()
+            await asyncio.gather(*self._connections.values(), return_exceptions=True)
+            await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                words = await readSentence(reader)
+                if not words:
+                    continue
+
+                self.requests += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+
+                for reply in self.execute(words, writer):
+                    writer.write(encodeSentence(reply))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._connections.pop(writer, None)
+            for listeners in self._listeners.values():
+                listeners[:] = [listener for listener in listeners if listener[0] is not writer]
+            writer.close()
+
+    # ──────────────────────────── commands ────────────────────────────
+    def execute(self, words: list[str], writer: asyncio.StreamWriter | None = None) -> list[list[str]]:
+        command, attributes, queries, tag = '/' + words[0].lstrip('/'), {}, {}, None
+        for word in words[1:]:
+            if word.startswith('.tag='):
+                tag = word[5:]
+            elif word.startswith('='):
+                key, _, value = word[1:].partition('=')
+                attributes[key] = value
+            elif word.startswith('?'):
+                key, _, value = word[1:].partition('=')
+                queries[key] = value
+
+        tagged = (lambda sentence: sentence + [f'.tag={tag}']) if tag is not None else (lambda sentence: sentence)
+        path, _, verb = command.rpartition('/')
+
+        if command == '/login':
+            return [tagged(['!done'])]
+        if command == '/cancel':
+            return self._cancel(writer, attributes.get('tag')) + [tagged(['!done'])]
+        if command == '/system/identity/print':
+            return [tagged(['!re', '=name=FakeRouterOS']), tagged(['!done'])]
+        if command == '/system/resource/print':
+            return [tagged(['!re', '=board-name=bench', '=version=7.0 (fake)']), tagged(['!done'])]
+
+        table = self.tables.get(path)
+        if table is None:
+            return [tagged(['!trap', f'=message=no such command prefix {path}']), tagged(['!done'])]
+
+        if verb == 'print':
+            proplist = attributes.get('.proplist')
+            fields = proplist.split(',') if proplist else None
+            replies = []
+            for row in table:
+                if all(row.get(key) == value for key, value in queries.items()):
+                    selected = row if fields is None else {key: row[key] for key in fields if key in row}
+                    replies.append(tagged(['!re', *(f'={key}={value}' for key, value in selected.items())]))
+            return replies + [tagged(['!done'])]
+
+        if verb == 'listen':
+            # Replies come from _notify until the listener is cancelled
+            self._listeners[path].append((writer, tag))
+            return []
+
+        if verb == 'add':
+            if 'name' in attributes and any(row.get('name') == attributes['name'] for row in table):
+                return [tagged(['!trap', '=message=failure: already have user with this name']), tagged(['!done'])]
+            attributes.setdefault('uptime', '0s')
+            row_id = self.insert(path, attributes)
+            return [tagged(['!done', f'=ret={row_id}'])]
+
+        if verb == 'remove':
+            targets = set((attributes.get('.id') or attributes.get('numbers') or '').split(','))
+            present = {row['.id'] for row in table} | {row.get('name') for row in table}
+            if not targets <= present:
+                return [tagged(['!trap', '=message=no such item']), tagged(['!done'])]
+            self.delete(path, targets)
+            return [tagged(['!done'])]
+
+        if verb == 'set':
+            target = attributes.pop('.id', None) or attributes.pop('numbers', None)
+            if self.update(path, target, attributes):
+                return [tagged(['!done'])]
+            return [tagged(['!trap', '=message=no such item']), tagged(['!done'])]
+
+        return [tagged(['!trap', f'=message=no such command {verb}']), tagged(['!done'])]
+
+    def _cancel(self, writer: asyncio.StreamWriter | None, tag: str | None) -> list[list[str]]:
+        for listeners in self._listeners.values():
+            for listener in listeners:
+                if listener == (writer, tag):
+                    listeners.remove(listener)
+                    return [['!trap', '=category=2', '=message=interrupted', f'.tag={tag}'], ['!done', f'.tag={tag}']]
+        return []
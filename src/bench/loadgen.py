@@ -0,0 +1,327 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed, InvalidStatus
+
+from bench.fake_arduino import FakeArduino
+from bench.fake_routeros import FakeRouterOS
+
+class PortalClient:
+    """
+    One simulated captive portal page on /request_login. Every message is kept with its
+    arrival time.
+    """
+    def __init__(self, index: int, url: str):
+        self.index = index
+        self.url = url
+        self.mac, self.ip = FakeRouterOS.client(index)
+
+        self.startedAt = None
+        self.firstMessageAt = None
+        self.messages: list[tuple[float, dict]] = []
+        self.closeCode = None
+        self.finished = asyncio.Event()
+
+        self._websocket = None
+        self._arrived = asyncio.Event()
+
+    @property
+    def served(self) -> bool:
+        """Whether a lane picked this client up, even if a stale position arrived after that."""
+        return any(message.get('status') != 'waiting' for _, message in self.messages)
+
+    @property
+    def windowOpen(self) -> bool:
+        """Still connected with a coin window running."""
+        return (not self.finished.is_set() and bool(self.messages)
+                and self.messages[-1][1].get('status') == 'receiving')
+
+    @property
+    def position(self) -> int | None:
+        if self.served:
+            return None
+        for _, message in reversed(self.messages):
+            return message['data']['queue_pos']
+        return None
+
+    async def run(self):
+        self.startedAt = time.monotonic()
+        try:
+            async with connect(self.url, ping_interval=None, open_timeout=30) as websocket:
+                self._websocket = websocket
+                await websocket.send(f'{self.mac},{self.ip}')
+                async for text in websocket:
+                    now = time.monotonic()
+                    if self.firstMessageAt is None:
+                        self.firstMessageAt = now
+                    self.messages.append((now, json.loads(text)))
+                    self._arrived.set()
+                self.closeCode = websocket.close_code
+        except InvalidStatus as e:
+            self.closeCode = f'http {e.response.status_code}'
+        except ConnectionClosed as e:
+            self.closeCode = e.rcvd.code if e.rcvd else 1006 # No close frame
+        except OSError as e:
+            self.closeCode = type(e).__name__
+        finally:
+            self.finished.set()
+            self._arrived.set()
+
+    async def leave(self):
+        if self._websocket is not None:
+            await self._websocket.close()
+
+    async def waitForMessage(self, after: float, status: str, timeout: float) -> float | None:
+        """Arrival time of the first `status` message received after `after`, or None."""
+        deadline = time.monotonic() + timeout
+        while True:
+            for at, message in self.messages:
+                if at > after and message.get('status') == status:
+                    return at
+            if self.finished.is_set() or time.monotonic() >= deadline:
+                return None
+
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                pass
+
+# ──────────────────────────── statistics ────────────────────────────
+def percentile(values: list[float], p: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+def summary(values: list[float], scale: float = 1000.0) -> dict:
+    """p50/p99/max in milliseconds."""
+    return {
+        'count': len(values),
+        'p50': None if not values else round(percentile(values, 50) * scale, 2),
+        'p99': None if not values else round(percentile(values, 99) * scale, 2),
+        'max': None if not values else round(max(values) * scale, 2),
+    }
+
+def processMemory(pid: int) -> dict:
+    """Resident and peak resident set size of `pid` in MiB, from /proc."""
+    memory = {}
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                key, _, value = line.partition(':')
+                if key in ('VmRSS', 'VmHWM'):
+                    memory[key] = round(int(value.split()[0]) / 1024, 1)
+    except OSError:
+        pass
+    return memory
+
+def freePort() -> int:
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+# ──────────────────────────── run ────────────────────────────
+async def waitReady(base_url: str, server: subprocess.Popen, timeout: float = 30.0):
+    """Poll /health until the backend reaches the router."""
+    loop = asyncio.get_running_loop()
+    deadline = time.monotonic() + timeout
+
+    def probe() -> bool:
+        try:
+            with urllib.request.urlopen(f'{base_url}/health', timeout=2) as response:
+                return response.status == 200
+        except (urllib.error.URLError, OSError):
+            return False
+
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        if await loop.run_in_executor(None, probe):
+            return
+        await asyncio.sleep(0.2)
+    raise RuntimeError("Server did not become ready")
+
+async def waitServing(clients: list[PortalClient], lanes: int, timeout: float):
+    """Wait until every lane has picked up a client, so the waiting line holds still."""
+    deadline = time.monotonic() + timeout
+    while sum(1 for c in clients if c.served) < lanes and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+
+async def measureDepartures(clients: list[PortalClient], departures: int, timeout: float) -> list[float]:
+    """
+    Disconnect the first waiting client `departures` times and time how long it takes until
+    every client behind it has its new position. Clients already on a lane are never picked.
+    """
+    fanouts = []
+    for _ in range(departures):
+        waiting = sorted((c for c in clients if not c.finished.is_set() and c.position is not None),
+                         key=lambda c: c.position)
+        if len(waiting) < 2:
+            break
+
+        leaving, behind = waiting[0], waiting[1:]
+        left_at = time.monotonic()
+        await leaving.leave()
+
+        arrivals = await asyncio.gather(*(c.waitForMessage(left_at, 'waiting', timeout) for c in behind))
+        received = [at - left_at for at in arrivals if at is not None]
+        if received:
+            fanouts.append(max(received))
+        await asyncio.sleep(0.2)
+    return fanouts
+
+def tickIntervals(clients: list[PortalClient]) -> list[float]:
+    """Deviation from 1 s between consecutive timer ticks of the same coin window."""
+    deviations = []
+    for client in clients:
+        ticks = [(at, message['data'].get('coin_count')) for at, message in client.messages
+                 if message.get('status') == 'receiving' and 'timer' in message.get('data', {})]
+        for (previous_at, previous_coins), (at, coins) in zip(ticks, ticks[1:]):
+            if coins != previous_coins:
+                continue # A coin wakes the timer early on purpose
+            deviations.append(abs(at - previous_at - 1.0))
+    return deviations
+
+async def run(args) -> dict:
+    router = FakeRouterOS(hosts=max(args.clients, 1), latency=args.router_latency)
+    router_port = await router.start()
+
+    arduinos = [FakeArduino(rate=args.frame_rate) for _ in range(args.lanes)]
+    for arduino in arduinos:
+        arduino.start()
+
+    state_dir = tempfile.mkdtemp(prefix='koinet-bench-')
+    port = freePort()
+    base_url = f'http://127.0.0.1:{port}'
+    env = dict(os.environ,
+               MIKROTIK_HOST='127.0.0.1',
+               MIKROTIK_PORT=str(router_port),
+               MIKROTIK_API_USER='bench',
+               MIKROTIK_API_PASS='bench',
+               ARDUINO_PORTS=','.join(arduino.path for arduino in arduinos),
+               KOINET_STATE_DIR=state_dir,
+               KOINET_LOG_LEVEL=args.log_level)
+    if not args.production_limits:
+        # Every simulated client connects from 127.0.0.1, lift the per-IP limit
+        env.update(KOINET_LOGIN_MAX_CONCURRENT=str(args.clients + 16),
+                   KOINET_LOGIN_RATE='1000',
+                   KOINET_LOGIN_BURST=str(args.clients + 16))
+
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'bench.server', '--port', str(port),
+         '--firebase-latency', str(args.firebase_latency)],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env=env)
+
+    clients: list[PortalClient] = []
+    tasks = []
+    try:
+        await waitReady(base_url, server)
+        idle_memory = processMemory(server.pid)
+
+        # Admission: everybody at once, time until the first message (position or timer)
+        url = f'ws://127.0.0.1:{port}/request_login'
+        clients = [PortalClient(index, url) for index in range(args.clients)]
+        tasks = [asyncio.create_task(client.run()) for client in clients]
+        await asyncio.gather(*(client.waitForMessage(0, 'waiting', args.timeout) for client in clients[args.lanes:]))
+        admitted = [c.firstMessageAt - c.startedAt for c in clients if c.firstMessageAt is not None]
+        loaded_memory = processMemory(server.pid)
+
+        # Queue broadcast: clients leaving the front of the line while the lanes are busy
+        await waitServing(clients, args.lanes, args.timeout)
+        fanouts = await measureDepartures(clients, args.departures, args.timeout)
+
+        # Coin windows: drop coins now and then and let the timers run
+        deadline = time.monotonic() + args.duration
+        while time.monotonic() < deadline:
+            await asyncio.sleep(args.coin_interval or 1)
+            if args.coin_interval:
+                for arduino in arduinos:
+                    arduino.insertCoin()
+
+        closes = {}
+        for client in clients:
+            if client.closeCode is not None and client.closeCode != 1000:
+                closes[str(client.closeCode)] = closes.get(str(client.closeCode), 0) + 1
+
+        return {
+            'clients': args.clients,
+            'lanes': args.lanes,
+            'admissionMs': summary(admitted),
+            'notAdmitted': args.clients - len(admitted),
+            'broadcastMs': summary(fanouts),
+            'tickJitterMs': summary(tickIntervals(clients)),
+            'approved': sum(1 for c in clients for _, m in c.messages if m.get('status') == 'approved'),
+            'denied': sum(1 for c in clients for _, m in c.messages if m.get('status') == 'denied'),
+            'openWindows': sum(1 for c in clients if c.windowOpen), # Coins kept them open past the run
+            'closeCodes': closes,
+            'routerRequests': router.requests,
+            'memoryMiB': {'idle': idle_memory, 'loaded': loaded_memory, 'end': processMemory(server.pid)},
+        }
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        server.terminate()
+        try:
+            server.wait(10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+        for arduino in arduinos:
+            arduino.stop()
+        await router.stop()
+
+def report(result: dict):
+    def line(name, stats):
+        print(f"{name:<22} n={stats['count']:<5} p50={stats['p50']} ms  p99={stats['p99']} ms  max={stats['max']} ms")
+
+    print(f"{result['clients']} clients, {result['lanes']} lane(s)")
+    line("admission", result['admissionMs'])
+    line("queue broadcast", result['broadcastMs'])
+    line("timer tick jitter", result['tickJitterMs'])
+    print(f"{'not admitted':<22} {result['notAdmitted']}")
+    print(f"{'outcomes':<22} approved={result['approved']} denied={result['denied']} "
+          f"still open={result['openWindows']}")
+    print(f"{'abnormal closes':<22} {result['closeCodes'] or 'none'}")
+    print(f"{'router requests':<22} {result['routerRequests']}")
+    for phase, memory in result['memoryMiB'].items():
+        print(f"{'memory ' + phase:<22} rss={memory.get('VmRSS')} MiB  peak={memory.get('VmHWM')} MiB")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Offline load test: the backend against a fake router, Arduino(s) and Firebase. Run from src/.")
+    parser.add_argument('--clients', type=int, default=100, help="concurrent portal clients")
+    parser.add_argument('--lanes', type=int, default=1, help="fake Arduinos / coin acceptors")
+    parser.add_argument('--departures', type=int, default=5, help="clients leaving the front of the line")
+    parser.add_argument('--duration', type=float, default=30.0, help="seconds of coin windows to observe")
+    parser.add_argument('--coin-interval', type=float, default=15.0, help="seconds between coins per lane, 0 for none")
+    parser.add_argument('--frame-rate', type=float, default=2.0, help="Arduino frames per second")
+    parser.add_argument('--router-latency', type=float, default=0.005, help="seconds per RouterOS reply")
+    parser.add_argument('--firebase-latency', type=float, default=0.05, help="seconds per Firebase call")
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--production-limits', action='store_true', help="keep the kiosk's admission limits")
+    parser.add_argument('--log-level', default='WARNING', help="backend log level")
+    parser.add_argument('--json', action='store_true', help="print the result as JSON")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        report(result)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+import argparse
+
+import uvicorn
+
+from bench.fake_firebase import FakeFirebase
+
+def main():
+    """
+    Run the backend against the in-memory Firebase. Router and Arduino addresses come from the
+    environment as usual (MIKROTIK_HOST/MIKROTIK_PORT, ARDUINO_PORTS), see bench.loadgen.
+    """
+    parser = argparse.ArgumentParser(description="Koinet backend with a fake Firebase")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--firebase-latency', type=float, default=0.0, help="seconds added to every Firebase call")
+    args = parser.parse_args()
+
+    # Must be in place before main builds its DatabaseAPI
+    FakeFirebase(latency=args.firebase_latency).install()
+
+    from main import app
+    uvicorn.run(app, host=args.host, port=args.port, log_level='warning')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+import threading
+from datetime import datetime, date
+from typing import Callable
+
+from storage.local_store import LocalStore
+
+class CoinCounterStore:
+    """
+    Local coin revenue counters with per-user, per-hour and per-day rollups.
+
+    Increments are applied under a lock and recorded in the local store, and the resulting
+    absolute totals are replicated to Firebase. Replication is at-least-once, so the replicated
+    values must be safe to apply twice: a replayed batch just writes the same totals again.
+    Concurrent lanes can't lose coins, an uplink outage can't either, and a login never waits on
+    a read-modify-write round trip. Layout in the database:
+
+        /monitoring/coin_input/{date}/{user}         coins per user (unchanged)
+        /monitoring/coin_totals/{date}/total         coins for the day
+        /monitoring/coin_totals/{date}/hourly/{HH}   coins per hour
+    """
+    def __init__(self, store: LocalStore, remote_totals: Callable[[str], dict | None] | None = None):
+        self._store = store
+        self._remoteTotals = remote_totals
+        self._lock = threading.Lock()
+
+        self._byUser: dict[tuple[str, str], int] = {}
+        self._byHour: dict[tuple[str, str], int] = {}
+        self._byDay: dict[str, int] = {}
+
+        self._load(date.today())
+
+    def _load(self, day: date):
+        """
+        Pick up the day's totals recorded before a restart. With nothing recorded locally (first
+        run, or a lost database) they start from `remote_totals`, so the absolute totals this
+        replicates don't overwrite what Firebase already counted today.
+        """
+        day = day.isoformat()
+        totals = self._store.coinTotals(day)
+        if not totals['users'] and self._remoteTotals is not None:
+            remote = self._remoteTotals(day)
+            if remote and remote['users']:
+                self._store.recordCoinBaseline(day, remote)
+                totals = remote
+
+        with self._lock:
+            for user, count in totals['users'].items():
+                self._byUser[(day, user)] = count
+            for hour, count in totals['hourly'].items():
+                self._byHour[(day, hour)] = count
+            self._byDay[day] = totals['total']
+
+    def add(self, user: str, coins: int, when: datetime | None = None) -> int:
+        """
+        Credit `coins` to `user` and return the user's total for the day.
+        """
+        when = when or datetime.now()
+        day = when.date().isoformat()
+        hour = f'{when.hour:02d}'
+
+        with self._lock:
+            user_total = self._byUser.get((day, user), 0) + coins
+            hour_total = self._byHour.get((day, hour), 0) + coins
+            day_total = self._byDay.get(day, 0) + coins
+            self._byUser[(day, user)] = user_total
+            self._byHour[(day, hour)] = hour_total
+            self._byDay[day] = day_total
+
+            # Queued under the lock so the outbox holds the totals in the order they were reached
+            self._store.recordCoins(user, coins, when, replicate=[
+                (f'/monitoring/coin_input/{day}/{user}', user_total),
+                (f'/monitoring/coin_totals/{day}/total', day_total),
+                (f'/monitoring/coin_totals/{day}/hourly/{hour}', hour_total),
+            ])
+
+        return user_total
+
+    def dayTotals(self, day: date | None = None) -> dict:
+        """
+        Totals recorded on this kiosk for one day (today by default).
+        """
+        day = (day or date.today()).isoformat()
+
+        with self._lock:
+            return {
+                'total': self._byDay.get(day, 0),
+                'hourly': {hour: count for (d, hour), count in sorted(self._byHour.items()) if d == day},
+                'users': {user: count for (d, user), count in self._byUser.items() if d == day},
+            }
+
+    def prune(self, keep_since: date):
+        """
+        Forget local counters for days before `keep_since`.
+        """
+        cutoff = keep_since.isoformat()
+
+        with self._lock:
+            self._byUser = {key: count for key, count in self._byUser.items() if key[0] >= cutoff}
+            self._byHour = {key: count for key, count in self._byHour.items() if key[0] >= cutoff}
+            self._byDay = {day: count for day, count in self._byDay.items() if day >= cutoff}
@@ -2,182 +2,323 @@ import firebase_admin
 from firebase_admin import credentials
 from firebase_admin import db
 from datetime import datetime, date, timedelta
-import json
-import re
+import logging
+import threading
+
+from firebase.write_behind import WriteBehindQueue
+from firebase.coin_counter import CoinCounterStore
+from firebase.replicator import FirebaseReplicator
+from firebase.retention import RetentionEngine, RetentionRule, olderThan
+from mikrotik_comm.models import HotspotUser, ActiveSession
+from storage.local_store import LocalStore
+from metrics.registry import REGISTRY, instrumented
+
+log = logging.getLogger(__name__)
+
+DATABASE_CALL_SECONDS = REGISTRY.histogram(
+    'koinet_database_call_seconds', 'Time spent in DatabaseAPI methods (local work, Firebase I/O is in the background)', ('method',))
+DATABASE_CALL_ERRORS = REGISTRY.counter(
+    'koinet_database_call_errors_total', 'DatabaseAPI calls that raised', ('method',))
 
 class DatabaseAPI:
-    def __init__(self, cert: str, url: str):
+    """
+    Database access for the kiosk. None of the update methods wait on the network.
+
+    Records that must not be lost (sessions, coins, energy rollups) go to the local SQLite
+    store first and are replicated to Firebase in the background. Live status that is only
+    worth its latest value (connected users, current voltage/current) goes through the
+    coalescing write-behind queue.
+    """
+    # Days of history kept in Firebase per dated path, overridable with `retention_days`
+    RETENTION_PATHS = {
+        'coin_input': '/monitoring/coin_input',
+        'coin_totals': '/monitoring/coin_totals',
+        'sessions': '/monitoring/sessions',
+        'hourly_power': '/monitoring/pltsStatus/rollups/hourly',
+        'daily_power': '/monitoring/pltsStatus/rollups/daily',
+    }
+    RETENTION_DAYS = {
+        'coin_input': 2,
+        'coin_totals': 31,
+        'sessions': 14,
+        'hourly_power': 31,
+        'daily_power': 366,
+    }
+
+    def __init__(self, cert: str, url: str, spill_path: str | None = None, store_path: str = 'koinet.db',
+                 retention_days: dict[str, int] | None = None, retention_interval: float = 6 * 3600):
         self._cred = credentials.Certificate(cert)
         self._url = url
 
-        self._lastSampleTime = None
-        self._hourlySample = []
+        self._connectedUsers = None # Last snapshot published to /monitoring/connectedUsers
+        self._connectedUsersLock = threading.Lock() # Orders publishes against retention deletes
 
         self._connectToFirebase()
 
-        self.databaseCleanup()
+        self._writer = WriteBehindQueue(spill_path=spill_path)
+        self._writer.start()
+
+        self._store = LocalStore(store_path)
+        self._replicator = FirebaseReplicator(self._store)
+        self._replicator.start()
+
+        self._coins = CoinCounterStore(self._store, remote_totals=self._remoteCoinTotals)
+
+        self._retentionDays = {**self.RETENTION_DAYS, **(retention_days or {})}
+        self._retention = RetentionEngine(self._retentionRules(), interval=retention_interval, on_run=self._pruneLocal)
+        self._retention.start() # Waits before its first pass, nothing here touches the network
+
+    def close(self):
+        """
+        Flush pending writes and stop the background threads.
+        """
+        self._store.flush(5)
+        self._retention.stop()
+        self._replicator.stop()
+        self._writer.stop()
+        self._store.close()
+
+    def _remoteCoinTotals(self, day: str) -> dict | None:
+        """
+        The coin totals Firebase holds for `day`, in coinTotals() form. None if unreadable.
+        """
+        try:
+            users = db.reference(f'/monitoring/coin_input/{day}').get() or {}
+            totals = db.reference(f'/monitoring/coin_totals/{day}').get() or {}
+        except Exception as e:
+            log.warning("Failed to read %s coin totals from Firebase, counting from zero: %s", day, e)
+            return None
+
+        hourly = totals.get('hourly') or {}
+        if isinstance(hourly, list): # Integer-like keys come back as a list
+            hourly = {f'{hour:02d}': count for hour, count in enumerate(hourly) if count}
+        users = {user: int(count) for user, count in users.items()}
+        return {
+            'users': users,
+            'hourly': {hour: int(count) for hour, count in hourly.items()},
+            'total': int(totals.get('total') or sum(users.values())),
+        }
+
+    @property
+    def writer(self) -> WriteBehindQueue:
+        return self._writer
+
+    @property
+    def coins(self) -> CoinCounterStore:
+        return self._coins
+
+    @property
+    def store(self) -> LocalStore:
+        return self._store
+
+    @property
+    def replicator(self) -> FirebaseReplicator:
+        return self._replicator
+
+    @property
+    def retention(self) -> RetentionEngine:
+        return self._retention
+
+    @property
+    def connectedUsers(self) -> dict:
+        """The snapshot last published to /monitoring/connectedUsers."""
+        return self._connectedUsers or {}
     
     def _connectToFirebase(self):
         firebase_admin.initialize_app(self._cred, {
             'databaseURL': self._url
         })
 
+    @instrumented(DATABASE_CALL_SECONDS, DATABASE_CALL_ERRORS)
     def updatePltsStatus(self, voltage: float, current: float):
-        now = datetime.now()
-
         if voltage < 0.0:
             voltage = 0.0
         
         if current < 0.0:
             current = 0.0
 
-        power = current * voltage
-
-        ref = db.reference('/monitoring/pltsStatus/')
-        ref.update({
+        self._writer.update('/monitoring/pltsStatus', {
             'currentAmpere': current,
             'currentVoltage': voltage
         })
 
-        # Handle initial sample or hourly transition
-        if self._lastSampleTime is None:
-            self._lastSampleTime = now
-            self._hourlySample.append(power)
-            print(f"Initial sample added: {power}W")
-            return
-
-        # Check for hour change (new hour started)
-        if now.hour != self._lastSampleTime.hour:
-            print(f"Hour changed from {self._lastSampleTime.hour} to {now.hour}. Processing hourly samples.")
-            self._updateHourlySample(hour = now.hour)
-            self._lastSampleTime = now
-            self._hourlySample.append(power) # Start new hour's sample
-            print(f"New hour's initial sample added: {power}W")
-            return
-
-        # Check for regular sample interval
-        # Use total_seconds() for robust comparison regardless of date/time components
-        time_since_last_sample = (now - self._lastSampleTime).total_seconds()
-        if time_since_last_sample >= 300:
-            self._hourlySample.append(power)
-            self._lastSampleTime = now
-            print(f"Sample added after {time_since_last_sample:.0f}s interval: {power}W")
-            return
-
-    def _updateHourlySample(self, hour: int):
-        ref = db.reference(f'/monitoring/pltsStatus/hourlyPowerOutput/{hour}')
-
-        powerOutput = sum(self._hourlySample) * (5 / 60) # Sum of samples divided by 5 minutes every sample.
-
-        ref.set(powerOutput)
-    
-    def _parse_mikrotik_time(self, timestr):
-        if timestr in ("", "never"):
-            return 0
-
-        time_units = {
-            'w': 7 * 24 * 3600,
-            'd': 24 * 3600,
-            'h': 3600,
-            'm': 60,
-            's': 1
+    @instrumented(DATABASE_CALL_SECONDS, DATABASE_CALL_ERRORS)
+    def publishPltsRollup(self, resolution: str, bucket: dict):
+        """
+        Publish a closed minute/hour/day rollup from the PLTS time series.
+        """
+        start = datetime.fromtimestamp(bucket['start'])
+        summary = {
+            'minPower': round(bucket['min'], 3),
+            'maxPower': round(bucket['max'], 3),
+            'avgPower': round(bucket['avg'], 3),
+            'energyWh': round(bucket['wh'], 3),
         }
 
-        total_seconds = 0
-        pattern = r'(\d+)([wdhms])'
-        matches = re.findall(pattern, timestr)
-
-        for value, unit in matches:
-            total_seconds += int(value) * time_units[unit]
-
-        return total_seconds
-    
+        if resolution == 'minute':
+            # Only the latest minute is shown live; the history stays in the local store
+            self._store.recordRollup(resolution, bucket)
+            self._writer.set('/monitoring/pltsStatus/lastMinute', summary)
+        elif resolution == 'hour':
+            # Keyed by the hour the energy was produced in
+            self._store.recordRollup(resolution, bucket, replicate=[
+                (f'/monitoring/pltsStatus/hourlyPowerOutput/{start.hour}', summary['energyWh']),
+                (f'/monitoring/pltsStatus/rollups/hourly/{start.date().isoformat()}/{start.hour:02d}', summary),
+            ])
+        elif resolution == 'day':
+            self._store.recordRollup(resolution, bucket, replicate=[
+                (f'/monitoring/pltsStatus/rollups/daily/{start.date().isoformat()}', summary),
+            ])
+
+    @instrumented(DATABASE_CALL_SECONDS, DATABASE_CALL_ERRORS)
     def updateCoinCount(self, user: str, coin: int):
-        today = date.today()
+        total_coin = self._coins.add(user, coin)
+        self._replicator.notify()
 
-        ref = db.reference(f'/monitoring/coin_input/{today.isoformat()}/{user}')
-        current_coin = ref.get() or 0
+        log.info("User of mac %s coin count is updated. Coins counted today by this kiosk: %d", user, total_coin)
 
-        total_coin = current_coin + coin
-        ref.set(total_coin)
-
-        print(f"User of mac {user} coin count is updated. Total coin input for today is: {total_coin}")
-
-    def databaseCleanup(self):
+    @instrumented(DATABASE_CALL_SECONDS, DATABASE_CALL_ERRORS)
+    def recordSession(self, mac: str, ip: str, lane: int, started_at: datetime, coins: int, minutes: int, outcome: str):
         """
-        Clean up unused database data
+        Keep a record of one coin window ('approved', 'denied' or 'failed').
         """
+        ended_at = datetime.now()
+        key = f"{started_at:%H%M%S}-{mac}"
+
+        self._store.recordSession(
+            key, mac, ip, lane, started_at.timestamp(), ended_at.timestamp(), coins, minutes, outcome,
+            replicate=[(f'/monitoring/sessions/{started_at.date().isoformat()}/{key}', {
+                'mac': mac,
+                'ip': ip,
+                'lane': lane,
+                'startedAt': started_at.isoformat(timespec='seconds'),
+                'endedAt': ended_at.isoformat(timespec='seconds'),
+                'coins': coins,
+                'minutes': minutes,
+                'outcome': outcome,
+            })]
+        )
+
+    def _retentionRules(self) -> list[RetentionRule]:
+        rules = [
+            RetentionRule(self.RETENTION_PATHS[name], olderThan(days))
+            for name, days in self._retentionDays.items() if name in self.RETENTION_PATHS
+        ]
+        # Sessions left behind by a previous run that the snapshot diff will never touch again
+        rules.append(RetentionRule('/monitoring/connectedUsers', self._isStaleConnectedUser,
+                                   delete=self._deleteStaleConnectedUsers))
+        return rules
+
+    def _isStaleConnectedUser(self, name: str) -> bool:
+        published = self._connectedUsers
+        return published is not None and name not in published
+
+    def _deleteStaleConnectedUsers(self, paths: list[str]) -> int:
+        """
+        Queue the deletes behind the live publishes. Each user is checked again against the
+        current snapshot, since it may have been republished after the keys were listed.
+        """
+        deleted = 0
+        with self._connectedUsersLock:
+            for path in paths:
+                if self._isStaleConnectedUser(path.rpartition('/')[2]):
+                    self._writer.delete(path)
+                    deleted += 1
+        return deleted
+
+    def _keepSince(self, name: str) -> date:
+        """First day kept under the retention window `name`, matching olderThan()."""
+        return date.today() - timedelta(days=self._retentionDays[name] - 1)
+
+    def _pruneLocal(self):
+        def start(day: date) -> float:
+            return datetime.combine(day, datetime.min.time()).timestamp()
+
+        self._coins.prune(self._keepSince('coin_input'))
+
+        # The local tables keep as much history as Firebase does; minute rollups, which only
+        # exist locally, as long as the hourly ones
+        coins_since = min(self._keepSince('coin_input'), self._keepSince('coin_totals'))
+        hourly_since = start(self._keepSince('hourly_power'))
+        self._store.prune(
+            sessions_before=start(self._keepSince('sessions')),
+            coins_before=coins_since.isoformat(),
+            telemetry_before={
+                'minute': hourly_since,
+                'hour': hourly_since,
+                'day': start(self._keepSince('daily_power')),
+            })
 
-        # Remove coin database
-        today_date = date.today()
-        yesterday_date = today_date - timedelta(days=1)
-
-        ref = db.reference(f'/monitoring/coin_input')
-        all_coin_data = ref.get()
-
-        if all_coin_data:
-            for date_str in all_coin_data:
-                try:
-                    current_date = date.fromisoformat(date_str)
-
-                    if current_date < yesterday_date:
-                        print(f"Deleting coin data at {current_date.isoformat()}")
-
-                        db.reference(f"/monitoring/coin_input/{current_date}").delete()
-                except ValueError:
-                    print(f"Failed to delete coin data at {date_str}: Invalid date value")
-                except Exception as e:
-                    print(f"Failed to delete coin data at {date_str}: {e}")
-
-
-    def updateConnectedUsers(self, all_users: str, active_users: str):
-        users = json.loads(all_users)
-        actives = json.loads(active_users)
+    @instrumented(DATABASE_CALL_SECONDS, DATABASE_CALL_ERRORS)
+    def updateConnectedUsers(self, all_users: list[HotspotUser], active_users: list[ActiveSession]):
+        """
+        Publish the active hotspot sessions to /monitoring/connectedUsers.
 
+        The last published snapshot is kept in memory so each call only queues what changed,
+        and the writer sends it with its next multi-path flush. Nothing is queued when the
+        router state is unchanged.
+        """
         # First check for active users before checking all users
-        updateList = []
-        for user in actives:
-            ref = db.reference(f'/monitoring/connectedUsers/{user.get('user')}')
-
-            ref.update({
-                'userIP': user.get('address'),
-                'userMAC': user.get('mac-address'),
-                'uptime': self._parse_mikrotik_time(user.get('session-time-left')),
-            })
+        snapshot = {}
+        for session in active_users:
+            if session.user is None:
+                continue
 
-            updateList.append(user.get('user'))
-            
-        for user in users:
+            snapshot[session.user] = {
+                'userIP': session.address,
+                'userMAC': session.mac_address,
+                'uptime': session.session_time_left,
+            }
+
+        for user in all_users:
             # Skip Nonetype account (bug or something)
-            if user.get('mac-address') is None or user.get('address') is None:
+            if user.mac_address is None or user.address is None:
                 continue
 
             # Only update for active users
-            if user.get('name') not in updateList:
+            if user.name not in snapshot:
                 continue
 
             # Skip default account
-            if (user.get('name') == 'default-trial'):
+            if (user.name == 'default-trial'):
                 continue
 
-            ref = db.reference(f'/monitoring/connectedUsers/{user.get('name')}')
+            snapshot[user.name]['uptimeLimit'] = user.limit_uptime
 
-            ref.update({
-                'uptimeLimit': self._parse_mikrotik_time(user.get('limit-uptime')),
-            })
+        with self._connectedUsersLock:
+            if self._connectedUsers is None:
+                # Nothing published by this process yet, replace whatever a previous run left behind
+                self._writer.set('/monitoring/connectedUsers', snapshot)
+            else:
+                delta = self._diffConnectedUsers(self._connectedUsers, snapshot)
+                if not delta:
+                    return
 
-        # Delete remaining user that are not active
-        ref = db.reference(f'/monitoring/connectedUsers')
-        dbUsers = ref.get()
+                self._writer.update('/monitoring/connectedUsers', delta)
 
-        if dbUsers:
-            for user in dbUsers.keys():
-                print(user)
-                if user not in updateList:
-                    ref.child(user).delete()
+            self._connectedUsers = snapshot
 
+    @staticmethod
+    def _diffConnectedUsers(previous: dict, current: dict) -> dict:
+        """
+        Build a multi-path update turning `previous` into `current`. Removed users and fields map to None.
+        """
+        delta = {}
 
+        for name in previous.keys() - current.keys():
+            delta[name] = None
 
+        for name, fields in current.items():
+            old_fields = previous.get(name)
+            if old_fields is None:
+                delta[name] = fields
+                continue
 
+            for key, value in fields.items():
+                if old_fields.get(key) != value:
+                    delta[f'{name}/{key}'] = value
 
+            for key in old_fields.keys() - fields.keys():
+                delta[f'{name}/{key}'] = None
 
+        return delta
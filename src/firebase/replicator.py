@@ -0,0 +1,111 @@
+import logging
+import threading
+import time
+
+from firebase_admin import db
+
+from firebase.write_behind import coalesceWrite, FIREBASE_UPDATE_SECONDS, FIREBASE_UPDATE_ERRORS
+from storage.local_store import LocalStore
+
+log = logging.getLogger(__name__)
+
+class FirebaseReplicator:
+    """
+    Streams the local store's outbox to Firebase in the background.
+
+    Rows are read in id order after the last checkpoint, coalesced into one multi-location
+    update per batch, and the checkpoint only advances once Firebase accepted the batch. After
+    an outage or a restart replication resumes exactly where it stopped.
+    """
+    CHECKPOINT = 'firebase'
+
+    def __init__(self, store: LocalStore, interval: float = 2.0, batch_size: int = 500, max_backoff: float = 60.0):
+        self._store = store
+        self._interval = interval
+        self._batch_size = batch_size
+        self._max_backoff = max_backoff
+
+        self._lastId = store.checkpoint(self.CHECKPOINT)
+        self._backoff = 0.0
+
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+        # Statistics
+        self.rowsReplicated = 0
+        self.batchErrors = 0
+        self.lastBatchAt = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="firebase-replicator", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def notify(self):
+        """
+        Replicate soon instead of waiting for the next interval.
+        """
+        self._wake.set()
+
+    @property
+    def backlog(self) -> int:
+        return self._store.outboxBacklog(self._lastId)
+
+    def stats(self) -> dict:
+        return {
+            'checkpoint': self._lastId,
+            'backlog': self.backlog,
+            'rowsReplicated': self.rowsReplicated,
+            'batchErrors': self.batchErrors,
+        }
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(max(self._interval, self._backoff))
+            self._wake.clear()
+
+            # Drain the backlog in consecutive batches while the uplink keeps up
+            while not self._stopping.is_set() and self._replicateBatch():
+                pass
+
+    def _replicateBatch(self) -> bool:
+        """
+        Send one batch. Returns True if a full batch went out and more may be waiting.
+        """
+        rows = self._store.readOutbox(self._lastId, self._batch_size)
+        if not rows:
+            return False
+
+        batch = {}
+        for _, path, value in rows:
+            coalesceWrite(batch, path.strip('/'), value)
+
+        started = time.monotonic()
+        try:
+            db.reference('/').update(batch)
+        except Exception as e:
+            FIREBASE_UPDATE_ERRORS.inc('replicator')
+            self.batchErrors += 1
+            self._backoff = min(max(self._backoff * 2, self._interval), self._max_backoff)
+            log.warning("Failed to replicate %d local records to Firebase, retrying in %.1fs: %s", len(rows), self._backoff, e)
+            return False
+
+        FIREBASE_UPDATE_SECONDS.observe(time.monotonic() - started, 'replicator')
+        self._backoff = 0.0
+        self._lastId = rows[-1][0]
+        self._store.setCheckpoint(self.CHECKPOINT, self._lastId)
+        self.rowsReplicated += len(rows)
+        self.lastBatchAt = time.time()
+
+        return len(rows) == self._batch_size
@@ -0,0 +1,157 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Callable
+
+from firebase_admin import db
+
+from metrics.registry import WORKER_LOOP_SECONDS
+
+log = logging.getLogger(__name__)
+
+def olderThan(days: int) -> Callable[[str], bool]:
+    """
+    Expiry test for ISO date keys that keeps the newest `days` days, today included.
+    Keys that aren't dates are never expired.
+    """
+    def expired(key: str) -> bool:
+        try:
+            return date.fromisoformat(key) <= date.today() - timedelta(days=days)
+        except ValueError:
+            return False
+
+    return expired
+
+@dataclass(slots=True)
+class RetentionRule:
+    path: str
+    expired: Callable[[str], bool]
+    # Takes over removing the expired paths and returns how many it removed, for paths that
+    # are also written live and must not be deleted behind the writer's back
+    delete: Callable[[list[str]], int] | None = None
+
+class RetentionEngine:
+    """
+    Scheduled retention for the Realtime Database.
+
+    Each pass lists the children of every rule's path with a shallow read (keys only, never the
+    data below them) and removes the expired ones in a single multi-location update, so the
+    cost of a pass depends on the number of keys and not on the size of the history. Rules
+    with their own `delete` are handed their expired paths instead.
+    """
+    def __init__(self, rules: list[RetentionRule], interval: float = 6 * 3600, initial_delay: float = 60.0,
+                 max_batch: int = 1000, on_run=None):
+        self._rules = rules
+        self._interval = interval
+        self._initial_delay = initial_delay
+        self._max_batch = max_batch
+        self._on_run = on_run
+
+        self._stopping = threading.Event()
+        self._thread = None
+
+        # Statistics
+        self.runs = 0
+        self.runErrors = 0
+        self.nodesDeleted = 0
+        self.lastRunAt = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="firebase-retention", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            'runs': self.runs,
+            'runErrors': self.runErrors,
+            'nodesDeleted': self.nodesDeleted,
+            'lastRunAt': self.lastRunAt,
+        }
+
+    def _run(self):
+        # Stay off the uplink while the kiosk is starting up
+        if self._stopping.wait(self._initial_delay):
+            return
+
+        while True:
+            with WORKER_LOOP_SECONDS.time('retention'):
+                self.runOnce()
+            if self._stopping.wait(self._interval):
+                return
+
+    def expiredPaths(self) -> list[tuple[RetentionRule, list[str]]]:
+        """
+        The expired paths under each rule's path.
+        """
+        expired = []
+        for rule in self._rules:
+            base = rule.path.strip('/')
+            try:
+                keys = db.reference(base).get(shallow=True)
+            except Exception as e:
+                self.runErrors += 1
+                log.warning("Failed to list %s for retention: %s", base, e)
+                continue
+
+            if not isinstance(keys, dict):
+                continue
+
+            paths = [f'{base}/{key}' for key in keys if rule.expired(key)]
+            if paths:
+                expired.append((rule, paths))
+
+        return expired
+
+    def runOnce(self) -> int:
+        """
+        Run one retention pass and return the number of nodes deleted.
+        """
+        paths = []
+        deleted = 0
+        for rule, expired in self.expiredPaths():
+            if rule.delete is None:
+                paths.extend(expired)
+                continue
+
+            try:
+                deleted += rule.delete(expired)
+            except Exception as e:
+                self.runErrors += 1
+                log.warning("Failed to delete %d expired nodes under %s: %s", len(expired), rule.path, e)
+
+        for i in range(0, len(paths), self._max_batch):
+            chunk = paths[i:i + self._max_batch]
+            try:
+                db.reference('/').update({path: None for path in chunk})
+                deleted += len(chunk)
+            except Exception as e:
+                self.runErrors += 1
+                log.warning("Failed to delete %d expired database nodes: %s", len(chunk), e)
+                break
+
+        if deleted:
+            log.info("Retention removed %d expired database nodes", deleted)
+
+        self.runs += 1
+        self.nodesDeleted += deleted
+        self.lastRunAt = time.time()
+
+        if self._on_run is not None:
+            try:
+                self._on_run()
+            except Exception as e:
+                log.exception("Retention hook failed: %s", e)
+
+        return deleted
@@ -0,0 +1,281 @@
+import copy
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+
+from firebase_admin import db
+
+from metrics.registry import REGISTRY
+
+log = logging.getLogger(__name__)
+
+FIREBASE_UPDATE_SECONDS = REGISTRY.histogram(
+    'koinet_firebase_update_seconds', 'Latency of multi-location updates sent to Firebase', ('source',))
+FIREBASE_UPDATE_ERRORS = REGISTRY.counter(
+    'koinet_firebase_update_errors_total', 'Multi-location updates Firebase rejected or never answered', ('source',))
+FIREBASE_WRITES_DROPPED = REGISTRY.counter(
+    'koinet_firebase_writes_dropped_total', 'Queued Firebase writes dropped because the backlog was full')
+
+def coalesceWrite(batch: dict, path: str, value) -> bool:
+    """
+    Fold one write into a multi-location update `batch`. Firebase rejects updates where one path
+    is an ancestor of another, so writes below a pending path are merged into its value and a
+    write above pending paths replaces them. Returns True if an earlier write was absorbed.
+    """
+    if path in batch:
+        batch[path] = copy.deepcopy(value)
+        return True
+
+    parts = path.split('/')
+    for depth in range(len(parts) - 1, 0, -1):
+        ancestor = '/'.join(parts[:depth])
+        if ancestor in batch:
+            tree = batch[ancestor]
+            if not isinstance(tree, dict):
+                tree = batch[ancestor] = {}
+            _assign(tree, parts[depth:], value)
+            return True
+
+    prefix = path + '/'
+    descendants = [key for key in batch if key.startswith(prefix)]
+    for key in descendants:
+        del batch[key]
+
+    batch[path] = copy.deepcopy(value)
+    return bool(descendants)
+
+def _assign(tree: dict, parts: list[str], value):
+    for part in parts[:-1]:
+        child = tree.get(part)
+        if not isinstance(child, dict):
+            child = tree[part] = {}
+        tree = child
+
+    if value is None:
+        tree.pop(parts[-1], None)
+    else:
+        tree[parts[-1]] = copy.deepcopy(value)
+
+class WriteBehindQueue:
+    """
+    Coalescing write-behind buffer in front of the Realtime Database.
+
+    Callers record writes by path and return immediately. A dedicated thread flushes
+    everything pending as one multi-location update every `flush_interval` seconds, so
+    repeated writes to the same path between flushes cost nothing. When the uplink is down
+    the coalesced batch is spilled to `spill_path` and retried with backoff, which also
+    carries it across a restart.
+
+    At most `max_pending` distinct paths are held, in memory and in the spill together; reaching
+    it flushes early, and past it the paths written longest ago are dropped and counted. Only
+    live status goes through here, so a long outage loses stale values, never records.
+    """
+    def __init__(self, flush_interval: float = 2.0, max_pending: int = 2000,
+                 spill_path: str | None = None, max_backoff: float = 60.0):
+        self._flush_interval = flush_interval
+        self._max_pending = max_pending
+        self._spill_path = spill_path
+        self._max_backoff = max_backoff
+
+        self._pending: dict[str, object] = {}
+        self._oldestPendingAt = None
+        self._lock = threading.Lock()
+
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+        self._backoff = 0.0
+        self._retryAt = 0.0
+
+        # Statistics
+        self.writesQueued = 0
+        self.writesCoalesced = 0
+        self.writesDropped = 0
+        self.flushes = 0
+        self.flushErrors = 0
+        self.lastFlushDuration = 0.0
+        self.lastFlushAt = None
+
+    # ──────────────────────────── lifecycle ────────────────────────────
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="firebase-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """
+        Flush what is pending and stop the writer thread. Anything that can't be sent stays spilled.
+        """
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    # ──────────────────────────── producers ────────────────────────────
+    def set(self, path: str, value):
+        """
+        Replace the value at `path`. None deletes it.
+        """
+        path = path.strip('/')
+        with self._lock:
+            self._coalesce(self._pending, path, value)
+            self.writesQueued += 1
+            if self._oldestPendingAt is None:
+                self._oldestPendingAt = time.monotonic()
+            self._trim(self._pending)
+            full = len(self._pending) >= self._max_pending
+
+        if full:
+            self._wake.set()
+
+    def update(self, path: str, fields: dict):
+        """
+        Same semantics as Reference.update(): only the given children of `path` are replaced.
+        """
+        path = path.strip('/')
+        for key, value in fields.items():
+            self.set(f'{path}/{key}', value)
+
+    def delete(self, path: str):
+        self.set(path, None)
+
+    # ──────────────────────────── reporting ────────────────────────────
+    @property
+    def backlog(self) -> int:
+        """Number of distinct paths waiting to be written."""
+        with self._lock:
+            return len(self._pending)
+
+    @property
+    def lag(self) -> float:
+        """Age in seconds of the oldest write not yet confirmed by Firebase."""
+        oldest = self._oldestPendingAt
+        return 0.0 if oldest is None else time.monotonic() - oldest
+
+    def stats(self) -> dict:
+        return {
+            'backlog': self.backlog,
+            'lag': self.lag,
+            'spilled': self._spill_path is not None and os.path.exists(self._spill_path),
+            'writesQueued': self.writesQueued,
+            'writesCoalesced': self.writesCoalesced,
+            'writesDropped': self.writesDropped,
+            'flushes': self.flushes,
+            'flushErrors': self.flushErrors,
+            'lastFlushDuration': self.lastFlushDuration,
+        }
+
+    # ──────────────────────────── coalescing ────────────────────────────
+    def _coalesce(self, batch: dict, path: str, value):
+        if coalesceWrite(batch, path, value):
+            self.writesCoalesced += 1
+
+    def _trim(self, batch: dict):
+        """
+        Drop the paths written longest ago (first in the dict) until `batch` fits in max_pending.
+        """
+        excess = len(batch) - self._max_pending
+        if excess <= 0:
+            return
+
+        for path in list(itertools.islice(batch, excess)):
+            del batch[path]
+        self.writesDropped += excess
+        FIREBASE_WRITES_DROPPED.inc(amount=excess)
+        log.warning("Firebase write backlog full, dropped the %d oldest pending writes", excess)
+
+    # ──────────────────────────── writer thread ────────────────────────────
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self._flush_interval)
+            self._wake.clear()
+
+            if time.monotonic() >= self._retryAt:
+                self._flush()
+
+        # Final attempt on shutdown
+        self._flush()
+
+    def _loadSpill(self) -> dict:
+        if self._spill_path is None or not os.path.exists(self._spill_path):
+            return {}
+
+        try:
+            with open(self._spill_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            log.error("Failed to read spilled Firebase writes from %s: %s", self._spill_path, e)
+            return {}
+
+    def _spill(self, batch: dict):
+        if self._spill_path is None:
+            return
+
+        try:
+            os.makedirs(os.path.dirname(self._spill_path) or '.', exist_ok=True)
+            tmp_path = self._spill_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(batch, f)
+            os.replace(tmp_path, self._spill_path)
+        except OSError as e:
+            log.error("Failed to spill Firebase writes to %s: %s", self._spill_path, e)
+
+    def _clearSpill(self):
+        if self._spill_path is not None and os.path.exists(self._spill_path):
+            os.remove(self._spill_path)
+
+    def _flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            oldest, self._oldestPendingAt = self._oldestPendingAt, None
+
+        # Writes spilled by an earlier failed flush (or a previous run) go first, newer writes on top
+        batch = self._loadSpill()
+        for path, value in pending.items():
+            self._coalesce(batch, path, value)
+
+        if not batch:
+            return
+
+        started = time.monotonic()
+        try:
+            db.reference('/').update(batch)
+        except Exception as e:
+            FIREBASE_UPDATE_ERRORS.inc('writer')
+            self.flushErrors += 1
+            self._backoff = min(max(self._backoff * 2, self._flush_interval), self._max_backoff)
+            self._retryAt = time.monotonic() + self._backoff
+            log.warning("Failed to flush %d Firebase writes, retrying in %.1fs: %s", len(batch), self._backoff, e)
+
+            if self._spill_path is None:
+                # Nowhere to spill, keep the batch in memory underneath anything written since
+                with self._lock:
+                    newer, self._pending = self._pending, batch
+                    for path, value in newer.items():
+                        self._coalesce(self._pending, path, value)
+                    self._trim(self._pending)
+            else:
+                with self._lock:
+                    self._trim(batch)
+                self._spill(batch)
+
+            with self._lock:
+                if oldest is not None and (self._oldestPendingAt is None or oldest < self._oldestPendingAt):
+                    self._oldestPendingAt = oldest
+            return
+
+        self._clearSpill()
+        self._backoff = 0.0
+        self._retryAt = 0.0
+        self.flushes += 1
+        self.lastFlushDuration = time.monotonic() - started
+        FIREBASE_UPDATE_SECONDS.observe(self.lastFlushDuration, 'writer')
+        self.lastFlushAt = time.time()
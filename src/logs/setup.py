@@ -0,0 +1,132 @@
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets at most `burst` records per message template (logger, level and unformatted message)
+    through every `interval` seconds. The first record after a window that had drops carries a
+    `suppressed` count, so nothing disappears silently.
+
+    Only the chatty `levels` are limited (debug output and repeated warnings, e.g. an unreachable
+    router); INFO records are the audit trail of logins and coins and are always kept, as are errors.
+    """
+    def __init__(self, burst: int = 5, interval: float = 10.0, max_keys: int = 1024,
+                 levels: frozenset[int] = frozenset({logging.DEBUG, logging.WARNING})):
+        super().__init__()
+        self._burst = burst
+        self._levels = levels
+        self._interval = interval
+        self._max_keys = max_keys
+        self._windows: dict[tuple, list] = {} # key -> [window start, passed, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno not in self._levels:
+            return True
+
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None:
+                if len(self._windows) >= self._max_keys:
+                    self._windows.clear()
+                window = self._windows[key] = [now, 0, 0]
+
+            if now - window[0] >= self._interval:
+                if window[2]:
+                    record.suppressed = window[2]
+                window[:] = [now, 0, 0]
+
+            if window[1] >= self._burst:
+                window[2] += 1
+                return False
+
+            window[1] += 1
+            return True
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        suppressed = getattr(record, 'suppressed', 0)
+        return f"{text} ({suppressed} similar messages suppressed)" if suppressed else text
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, for journald/log shippers.
+    """
+    _RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        # Anything passed through `extra=`
+        for key, value in vars(record).items():
+            if key not in self._RESERVED:
+                entry[key] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class _PreparedQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only merge the arguments here; formatting (and the JSON encoding) happens on the listener thread
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def configureLogging(level: str | None = None, json_output: bool | None = None,
+                     rate_burst: int | None = None, rate_interval: float | None = None) -> QueueListener:
+    """
+    Route every logger through a queue to a listener thread that does the actual writing, so the
+    event loop never blocks on stdout/journald. Settings default to the environment:
+
+        KOINET_LOG_LEVEL       DEBUG, INFO (default), WARNING, ...
+        KOINET_LOG_FORMAT      text (default) or json
+        KOINET_LOG_RATE        DEBUG/WARNING records per message template per interval, 0 disables (default 5)
+        KOINET_LOG_RATE_WINDOW interval in seconds (default 10)
+
+    Returns the started listener; stop() it on shutdown to flush.
+    """
+    level = (level or os.getenv("KOINET_LOG_LEVEL", "INFO")).upper()
+    if json_output is None:
+        json_output = os.getenv("KOINET_LOG_FORMAT", "text").lower() == "json"
+    if rate_burst is None:
+        rate_burst = int(os.getenv("KOINET_LOG_RATE", "5"))
+    if rate_interval is None:
+        rate_interval = float(os.getenv("KOINET_LOG_RATE_WINDOW", "10"))
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if json_output else TextFormatter())
+
+    records = queue.SimpleQueue()
+    handler = _PreparedQueueHandler(records)
+    if rate_burst > 0:
+        handler.addFilter(RateLimitFilter(rate_burst, rate_interval))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    listener = QueueListener(records, output, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -1,92 +1,195 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException, Query
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 import uvicorn
 import asyncio
-from asyncio import Queue, QueueEmpty
+import functools
+import logging
+from contextlib import asynccontextmanager
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 import os
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
+from logs.setup import configureLogging
+log = logging.getLogger("koinet")
+
 # ──────────────────────────── Class Imports ────────────────────────────
 from arduino.arduino_serial import ArduinoSerial
-from mikrotik_comm.mikrotik_comm import MikrotikAPI
+from mikrotik_comm.async_mikrotik import AsyncMikrotikAPI
+from mikrotik_comm.hotspot_cache import HotspotCache
+from mikrotik_comm.hotspot_feed import HotspotFeed, USERS
+from mikrotik_comm.user_reaper import UserReaper
 from firebase.database import DatabaseAPI
-import json
+from portal.waiting_room import WaitingRoom
+from portal.lanes import LoginLane, LaneDispatcher
+from portal.admission import AdmissionControl, clientAddress, parseLoginRequest
+from portal.hub import BroadcastHub, encode
+from telemetry.timeseries import PowerSeries
+from metrics.registry import REGISTRY, WORKER_LOOP_SECONDS
+from storage.checkpoint import Checkpoint
+from admin.snapshots import SnapshotCache, authorized
 
 # ──────────────────────────── MIKROTIK API ────────────────────────────
-ROS_HOST = "192.168.88.1"        # your router’s management IP
+ROS_HOST = os.getenv("MIKROTIK_HOST", "192.168.88.1")   # your router’s management IP
 USERNAME = os.getenv("MIKROTIK_API_USER")
 PASSWORD = os.getenv("MIKROTIK_API_PASS")
-PORT     = 8728                  # 8728 if you left SSL off
-mikrotik_api = MikrotikAPI(ROS_HOST, USERNAME, PASSWORD, PORT)
+PORT     = int(os.getenv("MIKROTIK_PORT", "8728"))     # 8728 if you left SSL off
+mikrotik_api = AsyncMikrotikAPI(ROS_HOST, USERNAME, PASSWORD, PORT)
+hotspot_feed = HotspotFeed(mikrotik_api)
+hotspot_cache = HotspotCache(mikrotik_api, users_live=lambda: hotspot_feed.isLive(USERS))
+
+def follow_hotspot_users(path, user, previous):
+    """Keep the login cache's user index current from the change feed."""
+    if path != USERS:
+        return
+    if previous is not None:
+        hotspot_cache.forgetUser(previous.name)
+    if user is not None:
+        hotspot_cache.addUser(user)
+
+hotspot_feed.subscribe(follow_hotspot_users)
+
+# Exhausted accounts are removed in the background, every minute
+user_reaper = UserReaper(mikrotik_api, lambda: hotspot_feed.users.values())
 
 # ──────────────────────────── COIN - DUINO ────────────────────────────
-dev_port = os.getenv("ARDUINO_PORT")
-arduino = ArduinoSerial(dev_port)
+# One Arduino per coin acceptor, e.g. ARDUINO_PORTS=/dev/ttyUSB0,/dev/ttyUSB1
+dev_ports = (os.getenv("ARDUINO_PORTS") or os.getenv("ARDUINO_PORT") or "").split(',')
+acceptors = [ArduinoSerial(port.strip() or None) for port in dev_ports]
+arduino = acceptors[0] # The PLTS power sensor is wired to the first Arduino
 
 # ──────────────────────────── FIREBASE ────────────────────────────
-db = DatabaseAPI(
-    'src/koinet-8bbee-firebase-adminsdk-fbsvc-3745e3e8c0.json',
-    'https://koinet-8bbee-default-rtdb.asia-southeast1.firebasedatabase.app/'
-    )
+# Local runtime state (spilled database writes, ...)
+STATE_DIR = os.getenv("KOINET_STATE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "state"))
+
+# Days of history kept in Firebase, e.g. KOINET_RETENTION=sessions=30,coin_totals=90
+retention_days = {}
+for entry in filter(None, os.getenv("KOINET_RETENTION", "").split(',')):
+    name, _, days = entry.partition('=')
+    retention_days[name.strip()] = int(days)
+
+# Opened by the lifespan: importing this module must not touch files, SQLite or Firebase, start
+# threads or take over logging
+db: DatabaseAPI | None = None
+power_series: PowerSeries | None = None
+log_listener = None
+
+def open_database() -> DatabaseAPI:
+    return DatabaseAPI(
+        'src/koinet-8bbee-firebase-adminsdk-fbsvc-3745e3e8c0.json',
+        'https://koinet-8bbee-default-rtdb.asia-southeast1.firebasedatabase.app/',
+        spill_path=os.path.join(STATE_DIR, "firebase_spill.json"),
+        store_path=os.path.join(STATE_DIR, "koinet.db"),
+        retention_days=retention_days
+        )
+
+# ──────────────────────────── PLTS TELEMETRY ────────────────────────────
+def open_power_series() -> PowerSeries:
+    return PowerSeries(
+        os.path.join(STATE_DIR, "plts_series.bin"),
+        on_rollup=lambda resolution, bucket: db.publishPltsRollup(resolution, bucket)
+        )
 
 # ──────────────────────────── data structures ────────────────────────────
 class LoginUser:
-        def __init__ (self, websocket: WebSocket, mac_address: str, ip_address: str):
-            self.websocket = websocket
+        def __init__ (self, websocket: WebSocket | None, mac_address: str, ip_address: str):
+            self.websocket = websocket # None for a login restored after a restart until its client reconnects
             self.mac_address = mac_address
             self.ip_address = ip_address
             self.done = asyncio.Event()
+            self.joined_at = time.monotonic()
+            self.joined_on = time.time() # Wall clock, for reports
+            self.started_at: datetime | None = None # Set when a lane starts serving it
+            self.detached_at = None # time.monotonic() it lost its socket to a restart
+
+login_queue = WaitingRoom()
+login_lanes = [LoginLane(index, acceptor) for index, acceptor in enumerate(acceptors)]
+login_sessions: dict[str, LoginUser] = {} # Waiting or being served, by MAC address
+
+# At most 64 login sockets at once; each IP and MAC may open a new one every 2 s after a burst of 5
+admission = AdmissionControl(
+    max_concurrent=int(os.getenv("KOINET_LOGIN_MAX_CONCURRENT", "64")),
+    rate=float(os.getenv("KOINET_LOGIN_RATE", "0.5")),
+    burst=int(os.getenv("KOINET_LOGIN_BURST", "5"))
+    )
 
-login_queue: Queue[LoginUser] = Queue(maxsize = 0)
+# Connections from these addresses are a local reverse proxy / tunnel (cloudflared) shared by every
+# client; their X-Forwarded-For decides the per-IP limit instead, and without one it is skipped
+TRUSTED_PROXIES = frozenset(filter(None, (address.strip() for address in
+                                          os.getenv("KOINET_TRUSTED_PROXIES", "127.0.0.1,::1").split(','))))
+
+# Outbound messages to portal clients; a client that can't take a frame within 5 s is dropped
+hub = BroadcastHub(max_queue=8, send_timeout=5.0)
+
+# ──────────────────────────── metrics ────────────────────────────
+QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    'koinet_queue_wait_seconds', 'Time a customer waited in line before a lane served it',
+    buckets=(1, 5, 10, 15, 30, 60, 120, 300, 600))
+LOGIN_OUTCOMES = REGISTRY.counter(
+    'koinet_login_outcomes_total', 'Finished coin windows by outcome', ('outcome',))
+COINS_ACCEPTED = REGISTRY.counter(
+    'koinet_coins_accepted_total', 'Coins credited to customers')
+
+REGISTRY.collected('koinet_queue_depth', 'Customers waiting in line', 'gauge',
+                   lambda: {(): len(login_queue)})
+REGISTRY.collected('koinet_lanes_busy', 'Lanes currently serving a customer', 'gauge',
+                   lambda: {(): sum(lane.busy for lane in login_lanes)})
+REGISTRY.collected('koinet_portal_clients', 'Open portal websockets', 'gauge',
+                   lambda: {(): len(hub)})
+REGISTRY.collected('koinet_portal_clients_dropped_total', 'Portal websockets dropped for being too slow', 'counter',
+                   lambda: {(): hub.dropped})
+REGISTRY.collected('koinet_login_rejected_total', 'Login sockets turned away by admission control', 'counter',
+                   lambda: {(reason,): count for reason, count in admission.rejected.items()}, ('reason',))
+
+def _per_acceptor(attribute: str) -> dict:
+    return {(acceptor.port,): getattr(acceptor, attribute) for acceptor in acceptors}
+
+REGISTRY.collected('koinet_serial_frames_total', 'Frames received from each Arduino', 'counter',
+                   lambda: _per_acceptor('framesReceived'), ('port',))
+REGISTRY.collected('koinet_serial_malformed_frames_total', 'Frames that failed to parse', 'counter',
+                   lambda: _per_acceptor('malformedFrames'), ('port',))
+REGISTRY.collected('koinet_serial_dropped_frames_total', 'Frames dropped as overlong or because the loop fell behind', 'counter',
+                   lambda: _per_acceptor('droppedFrames'), ('port',))
+REGISTRY.collected('koinet_serial_reconnects_total', 'Times a serial port was reopened', 'counter',
+                   lambda: _per_acceptor('reconnects'), ('port',))
+REGISTRY.collected('koinet_serial_last_frame_age_seconds', 'Seconds since the last frame from each Arduino', 'gauge',
+                   lambda: {(acceptor.port,): time.monotonic() - acceptor.lastFrameAt
+                            for acceptor in acceptors if acceptor.lastFrameAt is not None}, ('port',))
+
+REGISTRY.collected('koinet_firebase_writer_backlog', 'Paths waiting in the write-behind queue', 'gauge',
+                   lambda: {(): db.writer.backlog} if db is not None else {})
+REGISTRY.collected('koinet_firebase_writer_lag_seconds', 'Age of the oldest write not yet confirmed by Firebase', 'gauge',
+                   lambda: {(): db.writer.lag} if db is not None else {})
+REGISTRY.collected('koinet_firebase_replication_backlog', 'Local records not yet replicated to Firebase', 'gauge',
+                   lambda: {(): db.replicator.backlog} if db is not None else {})
 
 # ──────────────────────────── helpers ────────────────────────────
-import asyncio
-
-async def broadcast_positions() -> None:
-    """Tell each waiting client its position on the queue."""
-    temp_items = []
-    # No need for queue_pos = 0 here initially, we'll calculate it later
-
-    # Drain the queue into a temporary list
-    # The logic here is fine for getting all current items
-    while True:
-        try:
-            item = await asyncio.wait_for(login_queue.get(), timeout=0.01)
-            temp_items.append(item)
-        except asyncio.TimeoutError:
-            break
-        except Exception as e:
-            print(f"Error draining queue: {e}")
-            break
-
-    # Now iterate through the temporary list to broadcast and then put back
-    # The first waiting client should be position 1 (since position 0 is "in process")
-    # or you might want to consider 0 as the next-in-line
-    # If 0 is "current processing", then the first one in the queue is #1
-    start_pos_for_waiting_clients = 2 # <--- THE KEY CHANGE IS HERE!
-
-    for i, item in enumerate(temp_items): # Use enumerate to get index
-        try:
-            current_client_queue_pos = start_pos_for_waiting_clients + i # Offset by 1
-
-            await item.websocket.send_json(
-                {"status": "waiting", "data": {
-                    "queue_pos": current_client_queue_pos
-                }}
-            )
-            # Put the item back into the queue
-            await login_queue.put(item)
-            # queue_pos increment is now implicit with enumerate(i) + offset
-        except Exception as e:
-            print(f"An error occurred when broadcasting to clients: {e}")
-            # Ensure it's put back even on send error
-            await login_queue.put(item)
-
-    if not temp_items:
-        print("Queue is empty, no positions to broadcast.")
+@functools.lru_cache(maxsize=256)
+def waiting_message(position: int) -> str:
+    """Encoded once per position and reused for every client that reaches it."""
+    # Position 1 is the client currently being served, so the first waiting client is #2
+    return encode({"status": "waiting", "data": {
+        "queue_pos": position + 1
+    }})
+
+def broadcast_positions() -> None:
+    """Tell each waiting client whose place in line changed its new position."""
+    for item, position in login_queue.changedPositions():
+        # A newer position supersedes one the client hasn't received yet
+        hub.send(item.websocket, waiting_message(position), kind="position")
+
+async def wait_disconnect(websocket: WebSocket) -> int | None:
+    """Returns the close code once the client closes its websocket."""
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return message.get("code")
+    except RuntimeError:
+        return None # Already closed from our side
 
 async def update_coin_count(websocket, count):
     await websocket.send_json(
@@ -97,39 +200,23 @@ async def update_coin_count(websocket, count):
     )
 
 
-import re
-def parse_mikrotik_time(time_str: str) -> int:
-    """Parses MikroTik-style duration strings like '2w3d4h5m6s' into total seconds."""
-    time_units = {
-        'w': 7 * 24 * 60 * 60,
-        'd': 24 * 60 * 60,
-        'h': 60 * 60,
-        'm': 60,
-        's': 1,
-    }
-    
-    matches = re.findall(r'(\d+)([wdhms])', time_str)
-    total_seconds = 0
-    for value, unit in matches:
-        total_seconds += int(value) * time_units[unit]
-    return total_seconds
-
 # ──────────────────────────── background worker ────────────────────────────
 timeout_duration = 11  # Add 1 lag second
+resume_grace = 20 # Seconds a client cut off by a restart has to reconnect and reclaim its login
 
-async def _timer_task(item: LoginUser, timeout_duration_seconds: int, stop_event: asyncio.Event):
+async def _timer_task(item: LoginUser, lane: LoginLane, timeout_duration_seconds: int, stop_event: asyncio.Event):
     """
-    A standalone async function for managing a user's timer.
+    A standalone async function for managing a user's timer on one lane.
     This makes it more self-contained and testable.
     """
     timeout_start = datetime.now() # Base time for the current timer window
-    last_coin_count = arduino.coinCount
+    last_coin_count = lane.arduino.coinCount
 
     # Calculate remaining for the initial print statement
     initial_end_time = timeout_start + timedelta(seconds=timeout_duration_seconds)
     initial_remaining = (initial_end_time - datetime.now()).total_seconds()
 
-    print(f"[{item.mac_address}] _timer_task started. Initial remaining: {int(initial_remaining)}s")
+    log.info("[%s] _timer_task started on lane %d. Initial remaining: %ds", item.mac_address, lane.index, int(initial_remaining))
 
 
     while True:
@@ -140,206 +227,577 @@ async def _timer_task(item: LoginUser, timeout_duration_seconds: int, stop_event
         remaining = (end_time - now).total_seconds()
 
         # Add this print back to see loop progress
-        print(f"[{item.mac_address}] _timer_task loop: remaining={remaining:.2f}s, now={now}, end_time={end_time}")
+        log.debug("[%s] _timer_task loop: remaining=%.2fs, now=%s, end_time=%s", item.mac_address, remaining, now, end_time)
 
         if remaining <= 0:
-            print(f"[{item.mac_address}] Timer expired (remaining <= 0). Breaking loop.")
+            log.debug("[%s] Timer expired (remaining <= 0). Breaking loop.", item.mac_address)
             break # Timer has expired
 
-        # Check for new coins, extending the timer if detected
-        if arduino.coinCount > last_coin_count:
-            print(f"[{item.mac_address}] Coin detected for {item.mac_address}. Extending timer.")
-            last_coin_count = arduino.coinCount
+        # Check for new coins on this lane's acceptor, extending the timer if detected
+        last_coin_count = lane.arduino.coinCount
+        if lane.session.observe(last_coin_count):
+            log.info("[%s] Coin detected. Extending timer.", item.mac_address)
             timeout_start = datetime.now() # Reset timer base to now
             # CRITICAL: Recalculate end_time immediately after extending timeout_start
             # to ensure the first 'remaining' in the next loop iteration is correct
             end_time = timeout_start + timedelta(seconds=timeout_duration_seconds)
             remaining = (end_time - datetime.now()).total_seconds() # Update remaining after extension
 
-        try:
-            # Send current timer and coin count to the client
-            # ... (rest of your send_json logic) ...
-            await item.websocket.send_json(
-                {
-                    "status": "receiving",
-                    "data": {
-                        "timer": int(remaining),
-                        "coin_count": arduino.coinCount,
-                    }
+        # Queue current timer and coin count for the client; an unsent tick is replaced by this one.
+        # A restored login whose client hasn't reconnected yet keeps its window running.
+        sent = item.websocket is None or hub.send(item.websocket,
+            {
+                "status": "receiving",
+                "data": {
+                    "timer": int(remaining),
+                    "coin_count": lane.session.coins,
                 }
-            )
-            print(f"[{item.mac_address}] Sent timer update: {int(remaining)}s, coins: {arduino.coinCount}")
-
-        except Exception as e:
-            print(f"[{item.mac_address}] WebSocket closed or failed for {item.mac_address}: {e}")
+            },
+            kind="timer"
+        )
+        if not sent:
+            log.info("[%s] WebSocket closed or dropped", item.mac_address)
             if not stop_event.is_set():
                 stop_event.set()
             return # Exit the timer task early if the socket is closed
 
-        # Yield control to the event loop
-        await asyncio.sleep(1) # Check every second
+        log.debug("[%s] Sent timer update: %ds, coins: %d", item.mac_address, int(remaining), lane.session.coins)
+
+        # Sleep until the next one-second tick, but wake up as soon as a coin drops so the
+        # extension reaches the client immediately
+        await lane.arduino.waitForCoin(last_coin_count, timeout=min(1, remaining))
 
     # If the loop breaks (timer expired naturally), set the stop_event
     if not stop_event.is_set():
-        print(f"[{item.mac_address}] _timer_task naturally finished (timer expired). Setting stop_event.")
+        log.debug("[%s] _timer_task naturally finished (timer expired). Setting stop_event.", item.mac_address)
         stop_event.set()
 
 
-async def login_queue_worker():
-    while True:
-        item: LoginUser | None = None # Explicit type hint for clarity
-        try:
-            item = login_queue.get_nowait()
-        except QueueEmpty:
-            # If the queue is empty, yield control to prevent 100% CPU usage
-            await asyncio.sleep(0.1) # Small sleep to let other tasks run
-            continue # Go back to the start of the while loop
-        except Exception as e:
-            print(f"Failed receiving queue item: {e}")
-            await asyncio.sleep(1) # Sleep on other errors too
-            continue # Go back to the start of the while loop
-
-        if item is not None:
-            stop_event = asyncio.Event() # Renamed from stopEvent for PEP8 compliance
-
-            print(f"Processing login request for {item.mac_address} at {datetime.now()}")
-
-            # Start the timer task
-            timer_task = asyncio.create_task(
-                _timer_task(item, timeout_duration, stop_event)
-            )
+async def serve_login(lane: LoginLane, item: LoginUser):
+    """
+    Run one customer's coin window on the lane the dispatcher assigned.
+    """
+    stop_event = asyncio.Event() # Renamed from stopEvent for PEP8 compliance
+    started_at = item.started_at = item.started_at or datetime.now()
+    # A restored client gets a while to reconnect before its window runs out
+    window = timeout_duration + (resume_grace if item.websocket is None else 0)
+    cancelled = False
+
+    log.info("Processing login request for %s on lane %d", item.mac_address, lane.index)
+    QUEUE_WAIT_SECONDS.observe(time.monotonic() - item.joined_at)
+
+    # Start the timer task
+    timer_task = asyncio.create_task(
+        _timer_task(item, lane, window, stop_event)
+    )
 
-            try:
-                await stop_event.wait() # Wait for the timer task to signal completion/stop
-                print(f"Timer for {item.mac_address} completed/stopped.")
-
-                # Ensure the timer task is cancelled if it's still running (e.g., if stop_event was set externally)
-                if not timer_task.done():
-                    timer_task.cancel()
-                    try:
-                        await timer_task # Await cancellation to avoid Task exception was never retrieved
-                    except asyncio.CancelledError:
-                        pass
-
-                # --- Logic after timer completion ---
-                if arduino.coinCount == 0: # Note: this arduino.coinCount check might need refinement
-                                           # If arduino.coinCount is a global, it affects ALL clients.
-                                           # You might want to track coins for THIS specific item/session.
-                    print("Queue finished. No coin is accepted")
-                    await item.websocket.send_json({"status": "denied", "reason": "no coin"})
-                else:
-                    time_minutes = arduino.coinCount * 30
-                    print(f"Approving login for {item.mac_address} for {time_minutes} minutes.")
-                    mikrotik_api.addHotspotUser(item.mac_address, item.ip_address, time_minutes)
-                    await asyncio.sleep(0.1)
-                    await item.websocket.send_json({"status": "approved", "time_minutes": time_minutes})
-
-                    db.updateCoinCount(item.mac_address, arduino.coinCount)
-
-                item.done.set() # Signal the request_login task that this item is done
-                arduino.resetCoinCount() # Reset coin counter on arduino
-                await broadcast_positions() # Finish queue. Broadcast positions to other
+    try:
+        await stop_event.wait() # Wait for the timer task to signal completion/stop
+        log.debug("Timer for %s completed/stopped.", item.mac_address)
 
+        # Ensure the timer task is cancelled if it's still running (e.g., if stop_event was set externally)
+        if not timer_task.done():
+            timer_task.cancel()
+            try:
+                await timer_task # Await cancellation to avoid Task exception was never retrieved
             except asyncio.CancelledError:
-                # This worker task itself might be cancelled if the server shuts down
-                print(f"Login worker for {item.mac_address} was cancelled.")
-                if not item.done.is_set():
-                    item.done.set() # Ensure the original request is unblocked
-            except Exception as e:
-                # Catch specific exceptions if possible, otherwise general Exception
-                print(f"An error occurred during login for {item.mac_address}: {e}")
-                # Ensure the item.done event is set even on error to unblock the client
-                if not item.done.is_set():
-                    item.done.set()
-                # Consider what to do with the item in the queue if an error occurs:
-                # Do you put it back? Do you try again? Or is it a terminal error?
+                pass
+
+        # --- Logic after timer completion ---
+        lane.session.observe(lane.arduino.coinCount) # Count a coin that landed right at the deadline
+        coins = lane.session.coins
+
+        if coins == 0:
+            log.info("Queue finished for %s. No coin is accepted", item.mac_address)
+            db.recordSession(item.mac_address, item.ip_address, lane.index, started_at, 0, 0, "denied")
+            LOGIN_OUTCOMES.inc("denied")
+            hub.send(item.websocket, {"status": "denied", "reason": "no coin"})
+        else:
+            time_minutes = coins * 30
+            log.info("Approving login for %s for %d minutes.", item.mac_address, time_minutes)
+
+            # The coins are in the box: recorded before the router call, they count even if it
+            # fails or the client already left
+            db.updateCoinCount(item.mac_address, coins)
+            COINS_ACCEPTED.inc(amount=coins)
+
+            outcome = "failed"
+            try:
+                added = await mikrotik_api.addHotspotUser(item.mac_address, item.ip_address, time_minutes)
+                if not added and hotspot_cache.getUser(item.mac_address) is not None:
+                    # Returning customer whose old account the reaper hasn't removed yet; it holds the name
+                    if await user_reaper.reap(await user_reaper.confirmExpired([item.mac_address])):
+                        added = await mikrotik_api.addHotspotUser(item.mac_address, item.ip_address, time_minutes)
+                if added:
+                    outcome = "approved"
+            finally:
+                hotspot_cache.invalidateUsers()
+                db.recordSession(item.mac_address, item.ip_address, lane.index, started_at, coins, time_minutes, outcome)
+
+            if outcome == "approved":
+                LOGIN_OUTCOMES.inc("approved")
+                await asyncio.sleep(0.1)
+                hub.send(item.websocket, {"status": "approved", "time_minutes": time_minutes})
+            else:
+                log.error("Router did not create the account for %s; %d coin(s) recorded", item.mac_address, coins)
+                LOGIN_OUTCOMES.inc("failed")
+                hub.send(item.websocket, {"status": "failed", "reason": "router unavailable"})
+
+    except asyncio.CancelledError:
+        # Cancelled at shutdown; the checkpoint holds the window, the next run resumes it
+        log.info("Login session for %s was cancelled.", item.mac_address)
+        cancelled = True
+        timer_task.cancel()
+        raise
+    except Exception as e:
+        # Catch specific exceptions if possible, otherwise general Exception
+        log.exception("An error occurred during login for %s: %s", item.mac_address, e)
+        LOGIN_OUTCOMES.inc("failed")
+    finally:
+        item.done.set() # Signal the request_login task that this item is done
+        if item.websocket is None and login_sessions.get(item.mac_address) is item:
+            del login_sessions[item.mac_address] # Restored and never reclaimed, nobody else cleans it up
+        if not cancelled:
+            await checkpoint.save() # The window is over, a restart must not serve it again
+            lane.arduino.resetCoinCount() # Reset coin counter on this lane's arduino
+        broadcast_positions() # Finish queue. Broadcast positions to other
 
 async def plts_status_worker():
+    # Nothing to report until the serial reader has parsed its first frame
+    while arduino.lastFrameAt is None:
+        await arduino.waitForChange()
+
     while True:
-        if arduino.voltage is None or arduino.current is None:
-            print("Cannot update PLTS Status: Data from Arduino is received as NoneType, skipping current loop.")
-        else:
-            db.updatePltsStatus(
-                arduino.voltage,
-                arduino.current,
-            )
+        with WORKER_LOOP_SECONDS.time("plts_status"):
+            if arduino.voltage is None or arduino.current is None:
+                log.warning("Cannot update PLTS Status: Data from Arduino is received as NoneType, skipping current loop.")
+            else:
+                db.updatePltsStatus(
+                    arduino.voltage,
+                    arduino.current,
+                )
         
         await asyncio.sleep(60)
 
+async def plts_telemetry_worker():
+    """
+    Feed every power sensor reading into the time series. Unchanged readings are re-sampled
+    every few seconds so steady output is still integrated; a silent Arduino is not.
+    """
+    while True:
+        await arduino.waitForChange(timeout=5)
+
+        if arduino.voltage is None or arduino.current is None or arduino.lastFrameAt is None:
+            continue
+        if time.monotonic() - arduino.lastFrameAt > 10:
+            continue # No fresh frames, don't extrapolate stale readings
+
+        with WORKER_LOOP_SECONDS.time("plts_telemetry"):
+            power_series.ingest(time.time(), arduino.voltage, arduino.current)
+
 async def connected_users_worker():
+    """
+    Publish the connected users whenever the hotspot feed reports a change.
+    """
     while True:
-        allUsers = mikrotik_api.getHotspotUsers()
+        await hotspot_feed.waitForChange()
+
+        with WORKER_LOOP_SECONDS.time("connected_users"):
+            db.updateConnectedUsers(list(hotspot_feed.users.values()), list(hotspot_feed.active.values()))
+
+        await asyncio.sleep(0.2) # Coalesce a burst of changes into one update
+
+# ──────────────────────────── admin read API ────────────────────────────
+# Dashboards poll these instead of Firebase. Every view is built from state the workers above
+# already keep in memory, at most once a second, so refreshing costs no cloud or router reads.
+ADMIN_TOKEN = os.getenv("KOINET_ADMIN_TOKEN")
+admin_views = SnapshotCache(ttl=1.0)
+
+def admin_connected_users() -> dict:
+    users = db.connectedUsers
+    return {"count": len(users), "users": users}
+
+def admin_queue() -> dict:
+    return {
+        "waiting": [
+            {"position": position, "mac": item.mac_address, "ip": item.ip_address,
+             "joinedAt": round(item.joined_on)}
+            for position, item in enumerate(login_queue, start=1)
+        ],
+        "lanes": [
+            {"lane": lane.index, "port": lane.arduino.port, "busy": lane.busy,
+             "mac": lane.item.mac_address if lane.item is not None else None,
+             "coins": lane.session.coins if lane.item is not None and lane.session is not None else 0}
+            for lane in login_lanes
+        ],
+    }
 
-        activeUsers = mikrotik_api.getHotspotActive()
-        
-        db.updateConnectedUsers(allUsers, activeUsers)
+def admin_plts() -> dict:
+    voltage, current = arduino.voltage, arduino.current
+    return {
+        "voltage": voltage,
+        "current": current,
+        "power": None if voltage is None or current is None else round(max(voltage, 0.0) * max(current, 0.0), 3),
+        "lastFrameAge": None if arduino.lastFrameAt is None else round(time.monotonic() - arduino.lastFrameAt, 1),
+        "minute": power_series.current("minute"),
+        "hour": power_series.current("hour"),
+        "day": power_series.current("day"),
+        "lastHours": power_series.latest("hour", 24),
+    }
+
+def admin_coins_today() -> dict:
+    return {"date": datetime.now().date().isoformat(), **db.coins.dayTotals()}
+
+admin_views.add("connected-users", admin_connected_users)
+admin_views.add("queue", admin_queue)
+admin_views.add("plts", admin_plts)
+admin_views.add("coins", admin_coins_today)
+
+# ──────────────────────────── warm restart ────────────────────────────
+# The waiting line and the coin windows in progress are checkpointed every second (when they
+# changed), so a restart puts everyone back where they were and keeps the coins already credited.
+# Energy samples and coin totals don't need this: PowerSeries and the local store persist them.
+restore_max_age = 600 # Older checkpoints are from a different crowd
+
+def checkpoint_state() -> dict:
+    return {
+        "queue": [[item.mac_address, item.ip_address, round(item.joined_on, 1)] for item in login_queue],
+        "lanes": [
+            [lane.index, lane.item.mac_address, lane.item.ip_address, round(lane.item.joined_on, 1),
+             round(lane.item.started_at.timestamp(), 1) if lane.item.started_at else None,
+             lane.session.coins, lane.session.lastSeen]
+            for lane in login_lanes
+            if lane.item is not None and lane.session is not None and not lane.item.done.is_set()
+        ],
+    }
 
-        await asyncio.sleep(2)
+checkpoint = Checkpoint(os.path.join(STATE_DIR, "runtime.json"), checkpoint_state)
+
+def _restored_login(mac_address: str, ip_address: str, joined_on: float) -> LoginUser:
+    item = LoginUser(None, mac_address, ip_address)
+    item.joined_on = joined_on
+    item.joined_at = time.monotonic() - max(time.time() - joined_on, 0) # Waiting time includes the downtime
+    item.detached_at = time.monotonic()
+    login_sessions[mac_address] = item
+    return item
+
+def restore_checkpoint(dispatcher: LaneDispatcher) -> int:
+    """
+    Put the logins saved by the previous run back in their lanes and in line, detached until
+    their clients reconnect. Returns how many were restored.
+    """
+    state = checkpoint.load(restore_max_age)
+    if state is None:
+        return 0
+
+    restored = 0
+    for index, mac_address, ip_address, joined_on, started_on, coins, last_seen in state.get("lanes", ()):
+        item = _restored_login(mac_address, ip_address, joined_on)
+        if started_on is not None:
+            item.started_at = datetime.fromtimestamp(started_on)
+
+        lane = login_lanes[index] if index < len(login_lanes) and not login_lanes[index].busy else None
+        if lane is None:
+            # Fewer acceptors than before; the old count means nothing on another Arduino
+            lane, last_seen = next((lane for lane in login_lanes if not lane.busy), None), None
+        if lane is None:
+            log.warning("[%s] No lane to resume its coin window on, %d credited coins dropped.", mac_address, coins)
+            del login_sessions[mac_address]
+            continue
+
+        dispatcher.resume(lane, item, coins, last_seen)
+        log.info("[%s] Resuming its coin window on lane %d with %d coins.", mac_address, lane.index, coins)
+        restored += 1
+
+    for mac_address, ip_address, joined_on in state.get("queue", ()):
+        if mac_address in login_sessions:
+            continue
+        login_queue.add(mac_address, _restored_login(mac_address, ip_address, joined_on))
+        restored += 1
+
+    log.info("Restored %d logins from a checkpoint %.1fs old.", restored, time.time() - state["savedAt"])
+    return restored
+
+async def expire_detached_worker():
+    """
+    Drop waiting logins whose client didn't come back within the grace period after a restart.
+    """
+    while True:
+        await asyncio.sleep(5)
+
+        now = time.monotonic()
+        expired = [item for item in login_queue
+                   if item.websocket is None and item.detached_at is not None and now - item.detached_at > resume_grace]
+        for item in expired:
+            login_queue.remove(item.mac_address)
+            item.done.set()
+            if login_sessions.get(item.mac_address) is item:
+                del login_sessions[item.mac_address]
+        if expired:
+            log.info("Dropped %d logins whose clients didn't reconnect after a restart.", len(expired))
+            broadcast_positions()
+
+# ──────────────────────────── startup ────────────────────────────
+startup_state = {"startedAt": None, "connected": False}
+background_tasks: set[asyncio.Task] = set()
+
+def run_in_background(coro) -> asyncio.Task:
+    """Start a task that lives until shutdown."""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+async def connect_clients():
+    """
+    Open the router connections and serial ports concurrently. Lookups that arrive before this
+    finishes simply connect on first use, so the portal never waits for it.
+    """
+    results = await asyncio.gather(
+        mikrotik_api.connect(),
+        *(acceptor.startSerial() for acceptor in acceptors),
+        return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            log.warning("Failed to connect a client on startup: %s", result)
+
+    startup_state["connected"] = True
+    log.info("Clients connected in %.2fs", time.monotonic() - startup_state['startedAt'])
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global db, power_series, log_listener
+    log_listener = configureLogging()
+    startup_state["startedAt"] = time.monotonic()
+    loop = asyncio.get_running_loop()
+    db = await loop.run_in_executor(None, open_database)
+    power_series = await loop.run_in_executor(None, open_power_series)
+
+    dispatcher = LaneDispatcher(login_queue, login_lanes, serve_login)
+    restore_checkpoint(dispatcher)
+
+    run_in_background(connect_clients())
+    run_in_background(dispatcher.run())
+    run_in_background(checkpoint.run())
+    run_in_background(expire_detached_worker())
+    run_in_background(plts_status_worker())
+    run_in_background(plts_telemetry_worker())
+    run_in_background(hotspot_feed.run())
+    run_in_background(connected_users_worker())
+    run_in_background(user_reaper.run())
+    run_in_background(hotspot_cache.run(5))
+    log.info("FastAPI Server startup session completed.")
+
+    yield
+
+    log.info("FastAPI Server shutting down...")
+    await checkpoint.freeze() # Before the coin windows are cancelled below
+    for task in list(background_tasks):
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+
+    for acceptor in acceptors:
+        await acceptor.stopSerial()
+    await mikrotik_api.close()
+    power_series.close()
+    power_series = None
+    await loop.run_in_executor(None, db.close) # Flush queued database writes
+    db = None
+    log.info("FastAPI Server shutdown completed.")
+    log_listener.stop() # Write out whatever is still queued
+    log_listener = None
 
 # ──────────────────────────── FAST API APP ────────────────────────────
-app = FastAPI()
-
-@app.on_event("startup")
-async def start_worker():
-    asyncio.create_task(login_queue_worker())
-    await arduino.startSerial()
-    await asyncio.sleep(3) # Give time to start serial comm
-    asyncio.create_task(plts_status_worker())
-    asyncio.create_task(connected_users_worker())
-    print("FastAPI Server startup session completed.")
-
-@app.on_event("shutdown")
-async def shutdown_worker():
-    print("FastAPI Server shutting down...")
-    await arduino.stopSerial() # Call your new stopSerial method
-    print("FastAPI Server shutdown completed.")
+app = FastAPI(lifespan=lifespan)
+
+@app.get("/health")
+async def health():
+    """
+    Readiness probe. 200 once the router answers (possibly without every coin acceptor), 503 before.
+    """
+    now = time.monotonic()
+
+    router_age = None if hotspot_cache.hostsUpdatedAt is None else now - hotspot_cache.hostsUpdatedAt
+    router_ok = router_age is not None and router_age < 30
+
+    serial = []
+    for acceptor in acceptors:
+        serial.append({
+            "port": acceptor.port,
+            "open": acceptor.ser is not None,
+            "lastFrameAge": None if acceptor.lastFrameAt is None else round(now - acceptor.lastFrameAt, 1),
+        })
+    serial_ok = all(port["open"] for port in serial)
+
+    if not router_ok:
+        status = "starting" if not startup_state["connected"] else "unavailable"
+    else:
+        status = "ok" if serial_ok else "degraded"
+
+    return JSONResponse(status_code=200 if router_ok else 503, content={
+        "status": status,
+        "uptime": round(now - startup_state["startedAt"], 1) if startup_state["startedAt"] else 0,
+        "components": {
+            "router": {
+                "ok": router_ok,
+                "hostsAge": None if router_age is None else round(router_age, 1),
+                "feed": hotspot_feed.stats(),
+                "reaper": user_reaper.stats(),
+            },
+            "serial": serial,
+            "database": {
+                "writerBacklog": db.writer.backlog,
+                "writerLag": round(db.writer.lag, 1),
+                "replicationBacklog": db.replicator.backlog,
+                "retention": db.retention.stats(),
+            },
+            "checkpoint": checkpoint.stats(),
+            "queue": len(login_queue),
+            "admission": admission.stats(),
+            "clients": hub.stats(),
+        },
+    })
+
+async def follow_login(item: LoginUser, websocket: WebSocket) -> None:
+    """
+    Hold the client's socket until its login is done. A reconnect from the same device takes the
+    item over, after which this socket no longer owns it and just returns.
+    """
+    done_task = asyncio.create_task(item.done.wait())
+    disconnect_task = asyncio.create_task(wait_disconnect(websocket))
+    await asyncio.wait({done_task, disconnect_task}, return_when=asyncio.FIRST_COMPLETED)
+    done_task.cancel()
+
+    if disconnect_task.done():
+        if item.websocket is not websocket:
+            return # Replaced by a newer socket from the same device
+
+        if disconnect_task.result() == 1012:
+            # Cut off by a server restart, not gone: keep its place for the reconnect
+            item.websocket = None
+            item.detached_at = time.monotonic()
+            log.info("[%s] Lost its socket to a restart, holding its login for %ds.", item.mac_address, resume_grace)
+            return
+
+        # Client left; drop it from the line if it was still waiting, and move everyone behind it up
+        if login_queue.get(item.mac_address) is item:
+            login_queue.remove(item.mac_address)
+            broadcast_positions()
+        item.done.set()
+
+    await item.done.wait()
+    disconnect_task.cancel()
+
+    if login_sessions.get(item.mac_address) is item:
+        del login_sessions[item.mac_address]
+
+async def resume_login(item: LoginUser, websocket: WebSocket) -> None:
+    """
+    Move an existing login over to a new socket from the same device, keeping its place in line.
+    """
+    previous, item.websocket = item.websocket, websocket
+    item.detached_at = None
+    if previous is not None:
+        await hub.unregister(previous, flush_timeout=0)
+        try:
+            await previous.close(code=4000, reason="Replaced by a newer connection")
+        except Exception:
+            pass # The old socket is usually already gone
+
+    log.info("[%s] Reconnected, keeping its place in line.", item.mac_address)
+    login_queue.reannounce(item.mac_address)
+    broadcast_positions()
+    await follow_login(item, websocket)
+
+@app.get("/metrics")
+async def metrics(request: Request):
+    """
+    Prometheus scrape endpoint, behind the admin token.
+    """
+    if not authorized(ADMIN_TOKEN, request.headers.get("authorization")):
+        return JSONResponse(status_code=401, content={"detail": "Unauthorized"})
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/admin/{view}")
+async def admin_view(view: str, request: Request):
+    """
+    Cached admin views: connected-users, queue, plts and coins (today's totals).
+    """
+    if not authorized(ADMIN_TOKEN, request.headers.get("authorization")):
+        return JSONResponse(status_code=401, content={"detail": "Unauthorized"})
+
+    status_code, body, media_type, headers = admin_views.respond(view, request.headers.get("if-none-match"))
+    return Response(content=body, status_code=status_code, media_type=media_type, headers=headers)
 
 @app.websocket("/request_login")
 async def request_login(websocket: WebSocket):
-    await websocket.accept()
+    # Turned away before any router or database work
+    peer = websocket.client.host if websocket.client else None
+    rejection = admission.admit(clientAddress(peer, websocket.headers.get("x-forwarded-for"), TRUSTED_PROXIES))
+    if rejection is not None:
+        await websocket.close(code=1013, reason=f"Try again later: {rejection}")
+        return
 
     try:
+        await websocket.accept()
+        hub.register(websocket)
+
         # Receive first data that includes mac address & ip address
         data = await websocket.receive_text()
-        mac_address, ip_address = data.split(',')
+        request = parseLoginRequest(data)
+        if request is None:
+            await websocket.close(code=1003, reason="Expected 'mac,ip'")
+            return
+        mac_address, ip_address = request
+
+        if not admission.allowMac(mac_address):
+            await websocket.close(code=1013, reason="Try again later: rate limited")
+            return
 
         # Validate the data from mikrotik connected hosts
-        if not mikrotik_api.checkHostConnected(mac_address, ip_address):
-            print("Host is not found. Terminating connection")
+        if not await hotspot_cache.hostConnected(mac_address, ip_address):
+            log.warning("Host %s / %s is not found. Terminating connection", mac_address, ip_address)
             await websocket.close(code=1003,
                            reason="MAC or IP not found; possible spoofing")
             return
+
+        # Same device and address still in line or being served: take over its session
+        item = login_sessions.get(mac_address)
+        if item is not None and item.ip_address == ip_address and not item.done.is_set():
+            await resume_login(item, websocket)
+            return
         
-        # Check if the user already have account on mikrotik
-        users = json.loads(mikrotik_api.getHotspotUsers())
-        for user in users:
-            if user.get('mac-address') == mac_address and user.get('address') == ip_address:
-                uptime_parsed = user.get('uptime')
-                limit_parsed = user.get('limit-uptime')
-
-                if (uptime_parsed >= limit_parsed):
-                    mikrotik_api.deleteHotspotUser(mac_address)
-                else:
-                    await websocket.send_json(
-                        {"status": "bypass", "data": {
-                            "login": "approved"
-                        }}
-                    )
-                    print("User already have quota. Skip login session")
-                    return
+        # Check if the user already have account with quota left on mikrotik
+        if await hotspot_cache.hasQuota(mac_address, ip_address):
+            await websocket.send_json(
+                {"status": "bypass", "data": {
+                    "login": "approved"
+                }}
+            )
+            log.info("User %s already have quota. Skip login session", mac_address)
+            return
         
-        print("Host detected. Adding client to queue.")
+        log.info("Host %s detected. Adding client to queue.", mac_address)
+
+        # The device moved to another address while waiting; its old entry can't be resumed
+        previous = login_queue.remove(mac_address)
+        if previous is not None:
+            previous.done.set()
 
-        # enqueue + mirror in waiting deque
         item = LoginUser(websocket, mac_address, ip_address)
-        await login_queue.put(item)
+        login_queue.add(mac_address, item)
+        login_sessions[mac_address] = item
 
         # immediately tell everybody their new positions
-        await broadcast_positions()
+        broadcast_positions()
 
-        await item.done.wait()
+        await follow_login(item, websocket)
     except Exception as err:
-        print("An error occured on user's login request", err)
+        log.exception("An error occured on user's login request: %s", err)
+    finally:
+        await hub.unregister(websocket) # Let the final approved/denied message go out first
+        admission.release()
 
 @app.get("/")
 async def home():
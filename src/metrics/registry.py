@@ -0,0 +1,215 @@
+import bisect
+import functools
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labelText(names: tuple[str, ...], values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def render(self) -> list[str]:
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}', *self._samples()]
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values) -> float:
+        return self._values.get(label_values, 0)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f'{self.name}{_labelText(self.labels, key)} {_number(value)}' for key, value in values]
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self._values: dict[tuple, float] = {}
+
+    def set(self, value: float, *label_values):
+        self._values[label_values] = value
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f'{self.name}{_labelText(self.labels, key)} {_number(value)}' for key, value in values]
+
+class Collected(_Metric):
+    """
+    Counter or gauge whose samples are read from the running objects only when scraped,
+    for values a component already keeps track of. Costs nothing between scrapes.
+    `collect()` returns {label values tuple: value}.
+    """
+    def __init__(self, name: str, help: str, kind: str, collect, labels: tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self.kind = kind
+        self._collect = collect
+
+    def _samples(self) -> list[str]:
+        return [f'{self.name}{_labelText(self.labels, key)} {_number(value)}' for key, value in self._collect().items()]
+
+# Seconds; tuned for calls that take from a millisecond (SQLite, cache) to tens of seconds (router timeouts)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self._bounds = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self._bounds, value)
+        with self._lock:
+            row = self._values.get(label_values)
+            if row is None:
+                row = self._values[label_values] = [0] * (len(self._bounds) + 1) + [0.0]
+            row[index] += 1
+            row[-1] += value
+
+    def time(self, *label_values) -> '_Timer':
+        """
+        Context manager that observes the duration of its block.
+        """
+        return _Timer(self, label_values)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            values = [(key, list(row)) for key, row in self._values.items()]
+
+        lines = []
+        for key, row in values:
+            cumulative = 0
+            for bound, count in zip((*self._bounds, float('inf')), row):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f'{self.name}_bucket{_labelText(self.labels, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labelText(self.labels, key)} {_number(row[-1])}')
+            lines.append(f'{self.name}_count{_labelText(self.labels, key)} {cumulative}')
+        return lines
+
+class _Timer:
+    __slots__ = ('_histogram', '_labels', '_start')
+
+    def __init__(self, histogram: Histogram, labels: tuple):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe(time.perf_counter() - self._start, *self._labels)
+        return False
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def collected(self, name: str, help: str, kind: str, collect, labels: tuple[str, ...] = ()) -> Collected:
+        return self.register(Collected(name, help, kind, collect, labels))
+
+    def unregister(self, name: str):
+        self._metrics.pop(name, None)
+
+    def render(self) -> str:
+        """
+        All metrics in the Prometheus text exposition format (version 0.0.4).
+        """
+        lines = []
+        for metric in list(self._metrics.values()):
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                log.warning("Failed to collect metric %s: %s", metric.name, e)
+        return '\n'.join(lines) + '\n'
+
+# Process-wide registry served on /metrics
+REGISTRY = Registry()
+
+WORKER_LOOP_SECONDS = REGISTRY.histogram(
+    'koinet_worker_loop_seconds', 'Duration of one iteration of a background worker loop', ('worker',))
+
+def instrumented(latency: Histogram, errors: Counter):
+    """
+    Method decorator recording call latency and errors, labelled with the method name.
+    A call counts as failed if it raises, or if the instance set `_callFailed` during the call
+    (for methods that report failures by printing instead of raising).
+    """
+    def decorate(method):
+        name = method.__name__
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            self._callFailed = False
+            start = time.perf_counter()
+            try:
+                result = method(self, *args, **kwargs)
+            except Exception:
+                errors.inc(name)
+                raise
+            finally:
+                latency.observe(time.perf_counter() - start, name)
+
+            if self._callFailed:
+                errors.inc(name)
+            return result
+
+        return wrapper
+
+    return decorate
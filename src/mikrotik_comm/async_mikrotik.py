@@ -0,0 +1,133 @@
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator
+
+from mikrotik_comm.mikrotik_comm import MikrotikAPI
+from mikrotik_comm.models import HotspotUser, ActiveSession, Host
+from mikrotik_comm.ros_stream import Change, RouterOsStream
+
+log = logging.getLogger(__name__)
+
+class AsyncMikrotikAPI:
+    """
+    Awaitable facade over MikrotikAPI.
+
+    routeros_api is a blocking socket library, so every call is handed to a small dedicated
+    thread pool. Each worker thread borrows one pre-authenticated connection from the pool,
+    which means a slow router only ever occupies those threads and never the event loop.
+    Subscriptions (watch) use one extra asyncio-native connection instead of a thread.
+    """
+    def __init__(self, host: str, username: str, password: str, port: str = "8728",
+                 pool_size: int = 2, health_check_interval: float = 30.0):
+        self._pool_size = max(1, pool_size)
+        self._health_check_interval = health_check_interval
+
+        self._clients = [MikrotikAPI(host, username, password, port) for _ in range(self._pool_size)]
+        self._lastUsed = {id(client): 0.0 for client in self._clients}
+
+        self._idle: asyncio.Queue[MikrotikAPI] = asyncio.Queue()
+        for client in self._clients:
+            self._idle.put_nowait(client)
+
+        self._executor = ThreadPoolExecutor(max_workers=self._pool_size, thread_name_prefix="mikrotik")
+        self._stream = RouterOsStream(host, username, password, port)
+
+    async def connect(self):
+        """
+        Authenticate every pooled connection concurrently.
+        """
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *(loop.run_in_executor(self._executor, client.connect) for client in self._clients),
+            return_exceptions=True
+        )
+
+        for result in results:
+            if isinstance(result, Exception):
+                log.warning("Failed to pre-authenticate RouterOS connection: %s", result)
+
+        now = time.monotonic()
+        for client, result in zip(self._clients, results):
+            if not isinstance(result, Exception):
+                self._lastUsed[id(client)] = now
+
+    async def close(self):
+        await self._stream.close()
+
+        loop = asyncio.get_running_loop()
+        for client in self._clients:
+            await loop.run_in_executor(self._executor, client._disconnectAPI)
+
+        self._executor.shutdown(wait=False)
+
+    def _runChecked(self, client: MikrotikAPI, method: str, *args):
+        """
+        Runs on an executor thread. Connections idle for longer than the health check interval
+        are pinged first and rebuilt if the router dropped them.
+        """
+        now = time.monotonic()
+        if now - self._lastUsed[id(client)] > self._health_check_interval:
+            if not client.isHealthy():
+                client.reconnect()
+
+        try:
+            return getattr(client, method)(*args)
+        finally:
+            self._lastUsed[id(client)] = time.monotonic()
+
+    async def _call(self, method: str, *args):
+        client = await self._idle.get()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor,
+                functools.partial(self._runChecked, client, method, *args)
+            )
+        except Exception:
+            # Force a health check on the next borrow instead of trusting a connection that just failed
+            self._lastUsed[id(client)] = 0.0
+            raise
+        finally:
+            self._idle.put_nowait(client)
+
+    async def query(self, path: str, where: dict[str, str] | None = None, fields=None) -> list[dict]:
+        return await self._call("query", path, where, fields)
+
+    async def removeByName(self, path: str, names: list[str]):
+        return await self._call("removeByName", path, names)
+
+    async def getHotspotUsers(self, where: dict[str, str] | None = None) -> list[HotspotUser]:
+        return await self._call("getHotspotUsers", where)
+
+    async def getHotspotActive(self, where: dict[str, str] | None = None) -> list[ActiveSession]:
+        return await self._call("getHotspotActive", where)
+
+    async def getHotspotHosts(self, where: dict[str, str] | None = None) -> list[Host]:
+        return await self._call("getHotspotHosts", where)
+
+    async def findHotspotHost(self, mac: str, ip: str) -> Host | None:
+        return await self._call("findHotspotHost", mac, ip)
+
+    async def findHotspotUser(self, mac: str, ip: str) -> HotspotUser | None:
+        return await self._call("findHotspotUser", mac, ip)
+
+    async def checkHostConnected(self, mac: str, ip: str) -> bool:
+        return await self._call("checkHostConnected", mac, ip)
+
+    async def getRouterInfo(self):
+        return await self._call("getRouterInfo")
+
+    async def addHotspotUser(self, mac: str, ip: str, time_minutes: int) -> bool:
+        return await self._call("addHotspotUser", mac, ip, time_minutes)
+
+    async def deleteHotspotUser(self, mac: str):
+        return await self._call("deleteHotspotUser", mac)
+
+    def watch(self, path: str, fields=None) -> AsyncIterator[Change]:
+        """
+        Async iterator of add/update/remove changes to a table, see RouterOsStream.watch.
+        """
+        return self._stream.watch(path, fields)
@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import time
+from typing import Callable
+
+from mikrotik_comm.async_mikrotik import AsyncMikrotikAPI
+from mikrotik_comm.models import HotspotUser, Host
+from metrics.registry import WORKER_LOOP_SECONDS
+
+log = logging.getLogger(__name__)
+
+class HotspotCache:
+    """
+    Shared, periodically refreshed copy of the /ip/hotspot/host and /ip/hotspot/user tables.
+
+    Login admission looks clients up in dict indexes instead of downloading both tables per
+    websocket. Whole tables are only fetched when the cache is older than its TTL, with
+    concurrent refreshes collapsed into one. A miss (a client that just joined the hotspot)
+    asks the router for that single row instead.
+
+    While `users_live()` is true the user index is kept current by someone else (the hotspot
+    feed, through addUser/forgetUser) and the router is never asked for users.
+    """
+    def __init__(self, api: AsyncMikrotikAPI, ttl: float = 5.0, users_live: Callable[[], bool] = lambda: False):
+        self._api = api
+        self._ttl = ttl
+        self._usersLive = users_live
+
+        self._hostsByMac = {}
+        self._hostsByMacIp = {}
+        self._usersByName = {}
+        self._usersByMacIp = {}
+        self._withQuota = set() # (mac, ip) of users with uptime left, decided when the user is indexed
+
+        self._hostsFetchedAt = 0.0
+        self._usersFetchedAt = 0.0
+        self.hostsUpdatedAt = None # Last successful host table download (monotonic), for health reporting
+
+        self._hostsLock = asyncio.Lock()
+        self._usersLock = asyncio.Lock()
+
+    # ──────────────────────────── index maintenance ────────────────────────────
+    def updateHosts(self, hosts: list[Host] | None):
+        if hosts is None:
+            return # Router unreachable, keep serving the previous snapshot
+
+        by_mac = {}
+        by_mac_ip = {}
+        for host in hosts:
+            by_mac[host.mac_address] = host
+            by_mac_ip[(host.mac_address, host.address)] = host
+
+        self._hostsByMac = by_mac
+        self._hostsByMacIp = by_mac_ip
+        self._hostsFetchedAt = self.hostsUpdatedAt = time.monotonic()
+
+    def addHost(self, host: Host):
+        self._hostsByMac[host.mac_address] = host
+        self._hostsByMacIp[(host.mac_address, host.address)] = host
+
+    def updateUsers(self, users: list[HotspotUser] | None):
+        """
+        Replace the user indexes with a fresh download of the table.
+        """
+        if users is None:
+            return
+
+        by_name = {}
+        by_mac_ip = {}
+        with_quota = set()
+        for user in users:
+            by_name[user.name] = user
+            by_mac_ip[(user.mac_address, user.address)] = user
+            if not user.isExpired:
+                with_quota.add((user.mac_address, user.address))
+
+        self._usersByName = by_name
+        self._usersByMacIp = by_mac_ip
+        self._withQuota = with_quota
+        self._usersFetchedAt = time.monotonic()
+
+    def addUser(self, user: HotspotUser):
+        key = (user.mac_address, user.address)
+        self._usersByName[user.name] = user
+        self._usersByMacIp[key] = user
+        if user.isExpired:
+            self._withQuota.discard(key)
+        else:
+            self._withQuota.add(key)
+
+    def forgetUser(self, name: str):
+        user = self._usersByName.pop(name, None)
+        if user is not None:
+            self._usersByMacIp.pop((user.mac_address, user.address), None)
+            self._withQuota.discard((user.mac_address, user.address))
+
+    def invalidateUsers(self):
+        self._usersFetchedAt = 0.0
+
+    # ──────────────────────────── refresh ────────────────────────────
+    async def _refreshHosts(self, max_age: float):
+        async with self._hostsLock:
+            # Another caller may have refreshed while we were waiting on the lock
+            if time.monotonic() - self._hostsFetchedAt < max_age:
+                return
+            self.updateHosts(await self._api.getHotspotHosts())
+            # Also stamped on failure so an unreachable router isn't hammered by every lookup
+            self._hostsFetchedAt = time.monotonic()
+
+    async def _refreshUsers(self, max_age: float):
+        if self._usersLive():
+            return
+
+        async with self._usersLock:
+            if time.monotonic() - self._usersFetchedAt < max_age:
+                return
+            self.updateUsers(await self._api.getHotspotUsers())
+            self._usersFetchedAt = time.monotonic()
+
+    async def refresh(self):
+        await self._refreshHosts(0)
+        await self._refreshUsers(0)
+
+    async def run(self, interval: float):
+        """
+        Background refresh loop so lookups normally never wait on the router.
+        """
+        while True:
+            try:
+                with WORKER_LOOP_SECONDS.time('hotspot_cache'):
+                    await self._refreshHosts(interval)
+                    await self._refreshUsers(interval)
+            except Exception as e:
+                log.warning("Failed to refresh hotspot cache: %s", e)
+
+            await asyncio.sleep(interval)
+
+    # ──────────────────────────── lookups ────────────────────────────
+    async def hostConnected(self, mac: str, ip: str) -> bool:
+        await self._refreshHosts(self._ttl)
+        if (mac, ip) in self._hostsByMacIp:
+            return True
+
+        # Unknown client, it may have joined the hotspot after the last refresh
+        host = await self._api.findHotspotHost(mac, ip)
+        if host is None:
+            return False
+
+        self.addHost(host)
+        return True
+
+    async def findUser(self, mac: str, ip: str) -> HotspotUser | None:
+        await self._refreshUsers(self._ttl)
+        user = self._usersByMacIp.get((mac, ip))
+        if user is not None:
+            return user
+
+        if self._usersLive():
+            return None # The index is complete
+
+        # Most customers have no account yet, this is the common case for a new login
+        user = await self._api.findHotspotUser(mac, ip)
+        if user is not None:
+            self.addUser(user)
+        return user
+
+    async def hasQuota(self, mac: str, ip: str) -> bool:
+        """
+        Whether the client already has an account with uptime left and can skip the coin window.
+        Exhausted accounts count as none; the reaper removes them.
+
+        The index only tells who may have quota: /listen doesn't announce uptime changes, so a
+        mirrored row can be a minute stale. A bypass is granted on a fresh point lookup only.
+        """
+        await self.findUser(mac, ip) # Refreshes and indexes the account if there is one
+        if (mac, ip) not in self._withQuota:
+            return False
+
+        user = await self._api.findHotspotUser(mac, ip)
+        if user is None:
+            return False # Gone, or the router is unreachable; the coin window is the safe answer
+        self.addUser(user)
+        return not user.isExpired
+
+    def getHost(self, mac: str) -> Host | None:
+        return self._hostsByMac.get(mac)
+
+    def getUser(self, name: str) -> HotspotUser | None:
+        return self._usersByName.get(name)
@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import time
+from contextlib import aclosing
+from typing import Callable
+
+from mikrotik_comm.async_mikrotik import AsyncMikrotikAPI
+from mikrotik_comm.models import HotspotUser, ActiveSession
+from metrics.registry import WORKER_LOOP_SECONDS
+
+log = logging.getLogger(__name__)
+
+USERS = '/ip/hotspot/user'
+ACTIVE = '/ip/hotspot/active'
+
+class HotspotFeed:
+    """
+    Live mirror of the /ip/hotspot/user and /ip/hotspot/active tables.
+
+    Both tables are followed with RouterOS `listen`, so logins and logouts reach the listeners
+    as they happen and an idle hotspot costs no router traffic. A slow reconciling poll
+    replaces the mirrors with fresh downloads as a safety net (and refreshes counters like
+    session-time-left, which the router doesn't announce), and falls back to the old fast
+    polling while a stream is down.
+    """
+    MODELS = {USERS: HotspotUser, ACTIVE: ActiveSession}
+
+    def __init__(self, api: AsyncMikrotikAPI, reconcile_interval: float = 60.0, poll_interval: float = 2.0,
+                 retry_interval: float = 5.0):
+        self._api = api
+        self._reconcile_interval = reconcile_interval
+        self._poll_interval = poll_interval
+        self._retry_interval = retry_interval
+
+        self.tables: dict[str, dict] = {path: {} for path in self.MODELS}
+        self._live = set() # Paths whose stream is synced and open
+        self._listeners: list[Callable] = []
+        self._changed = asyncio.Event()
+
+        # Statistics
+        self.changes = 0
+        self.reconciles = 0
+        self.streamErrors = 0
+        self.lastChangeAt = None
+
+    @property
+    def users(self) -> dict[str, HotspotUser]:
+        return self.tables[USERS]
+
+    @property
+    def active(self) -> dict[str, ActiveSession]:
+        return self.tables[ACTIVE]
+
+    def isLive(self, path: str) -> bool:
+        return path in self._live
+
+    def subscribe(self, listener: Callable):
+        """
+        listener(path, record, previous) is called for every change: record is None for a
+        removal, previous is None for an addition.
+        """
+        self._listeners.append(listener)
+
+    async def waitForChange(self):
+        """Returns once anything changed (or a table was first synced) since the last call."""
+        await self._changed.wait()
+        self._changed.clear()
+
+    def stats(self) -> dict:
+        return {
+            'live': sorted(self._live),
+            'users': len(self.users),
+            'active': len(self.active),
+            'changes': self.changes,
+            'reconciles': self.reconciles,
+            'streamErrors': self.streamErrors,
+        }
+
+    # ──────────────────────────── mirror ────────────────────────────
+    def _apply(self, path: str, row_id: str, record):
+        table = self.tables[path]
+        previous = table.get(row_id)
+        if record is None:
+            if previous is None:
+                return
+            del table[row_id]
+        else:
+            if previous == record:
+                return
+            table[row_id] = record
+
+        self.changes += 1
+        self.lastChangeAt = time.monotonic()
+        self._changed.set()
+        for listener in self._listeners:
+            try:
+                listener(path, record, previous)
+            except Exception as e:
+                log.exception("Hotspot feed listener failed: %s", e)
+
+    def _replace(self, path: str, records: dict):
+        for row_id in self.tables[path].keys() - records.keys():
+            self._apply(path, row_id, None)
+        for row_id, record in records.items():
+            self._apply(path, row_id, record)
+
+    # ──────────────────────────── workers ────────────────────────────
+    async def run(self):
+        await asyncio.gather(*(self._follow(path) for path in self.MODELS), self._reconcileLoop())
+
+    async def _follow(self, path: str):
+        model = self.MODELS[path]
+        while True:
+            snapshot = {}
+            try:
+                async with aclosing(self._api.watch(path, model.FIELDS)) as changes:
+                    async for change in changes:
+                        if change.kind == 'synced':
+                            # Also drops rows removed while the stream was down
+                            self._replace(path, snapshot)
+                            self._live.add(path)
+                            self._changed.set()
+                            log.info("Following %s (%d rows)", path, len(snapshot))
+                        elif path not in self._live:
+                            snapshot[change.id] = model.fromApi({'id': change.id, **change.row})
+                        elif change.kind == 'remove':
+                            self._apply(path, change.id, None)
+                        else:
+                            self._apply(path, change.id, model.fromApi({'id': change.id, **change.row}))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.streamErrors += 1
+                log.warning("Lost the %s change stream, polling until it's back: %s", path, e)
+            finally:
+                self._live.discard(path)
+
+            await asyncio.sleep(self._retry_interval)
+
+    async def reconcile(self):
+        users = await self._api.getHotspotUsers()
+        active = await self._api.getHotspotActive()
+        if users is not None:
+            self._replace(USERS, {user.id: user for user in users})
+        if active is not None:
+            self._replace(ACTIVE, {session.id: session for session in active})
+        self.reconciles += 1
+
+    async def _reconcileLoop(self):
+        waited = 0.0
+        while True:
+            await asyncio.sleep(self._poll_interval)
+            waited += self._poll_interval
+
+            # Every poll interval while a stream is down, otherwise only now and then
+            if len(self._live) == len(self.MODELS) and waited < self._reconcile_interval:
+                continue
+
+            waited = 0.0
+            try:
+                with WORKER_LOOP_SECONDS.time('hotspot_reconcile'):
+                    await self.reconcile()
+            except Exception as e:
+                log.warning("Failed to reconcile hotspot tables: %s", e)
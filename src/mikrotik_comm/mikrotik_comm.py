@@ -1,8 +1,20 @@
 from routeros_api import RouterOsApiPool, exceptions, api
 
 import argparse
+import logging
+import socket
 import sys
-import json
+from typing import Iterable
+
+from mikrotik_comm.models import HotspotUser, ActiveSession, Host
+from metrics.registry import REGISTRY, instrumented
+
+log = logging.getLogger(__name__)
+
+ROUTER_CALL_SECONDS = REGISTRY.histogram(
+    'koinet_router_call_seconds', 'Latency of RouterOS API calls', ('method',))
+ROUTER_CALL_ERRORS = REGISTRY.counter(
+    'koinet_router_call_errors_total', 'RouterOS API calls that failed', ('method',))
 
 ROS_HOST = "192.168.88.1"        # your router’s management IP
 
@@ -18,6 +30,8 @@ class MikrotikAPI:
         self._username = username
         self._password = password
         self._port = port
+        self._callFailed = False # Set by methods that report a failure by printing it
+        self._tunedSocket = None
 
         self._connectToAPI()
 
@@ -31,78 +45,155 @@ class MikrotikAPI:
                 plaintext_login=True
             )
         except Exception as e:
-            print("Exception when connecting to RouterOS API: " + e)
+            log.error("Exception when connecting to RouterOS API: %s", e)
 
     def _disconnectAPI(self):
         try:
             self._pool.disconnect()
         except Exception as e:
-            print("Failed to disconnect from API: " + e)
+            log.warning("Failed to disconnect from API: %s", e)
+
+    def _getApi(self):
+        api = self._pool.get_api()
+
+        # routeros_api sends every word of a sentence as its own segment; with Nagle's algorithm
+        # each one after the first waits for the router's delayed ACK, ~40 ms per small query
+        sock = getattr(self._pool.socket, 'socket', None)
+        if sock is not None and sock is not self._tunedSocket:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._tunedSocket = sock
+        return api
+
+    def connect(self):
+        """
+        Open and authenticate the RouterOS connection up front so the first real call doesn't pay for the login.
+        """
+        self._getApi()
+
+    def reconnect(self):
+        self._disconnectAPI()
+        self._connectToAPI()
+        try:
+            self.connect()
+        except Exception as e:
+            log.warning("Failed to reconnect to RouterOS API: %s", e)
 
-    def getHotspotUsers(self) -> str:
+    @instrumented(ROUTER_CALL_SECONDS, ROUTER_CALL_ERRORS)
+    def isHealthy(self) -> bool:
+        """
+        Cheap round trip to the router, used by the async pool before reusing an idle connection.
+        """
         try:
-            api = self._pool.get_api()
+            api = self._getApi()
+            api.get_resource("/system/identity").get()
+            return True
+        except Exception as e:
+            log.warning("RouterOS health check failed: %s", e)
+            self._callFailed = True
+            return False
 
-            host_list = api.get_resource("/ip/hotspot/user")
-            hosts = host_list.get()
+    # ──────────────────────────── queries ────────────────────────────
+    # Metrics are recorded where a request goes to the router (query, removeByName and the few
+    # methods that talk to the API directly), so helpers built on them aren't counted twice.
+    @instrumented(ROUTER_CALL_SECONDS, ROUTER_CALL_ERRORS)
+    def query(self, path: str, where: dict[str, str] | None = None, fields: Iterable[str] | None = None) -> list[dict]:
+        """
+        Print `path` with the filtering and projection done on the router: `where` becomes
+        ?key=value queries (all must match) and `fields` the .proplist. Raises on failure,
+        unlike the helpers built on it.
+        """
+        arguments = {'proplist': ','.join('.id' if field == 'id' else field for field in fields)} if fields else {}
+
+        api = self._getApi()
+        return api.get_resource(path).call('print', arguments, where or {})
+
+    @instrumented(ROUTER_CALL_SECONDS, ROUTER_CALL_ERRORS)
+    def removeByName(self, path: str, names: Iterable[str]):
+        """
+        Remove items by name (or .id) in one round trip, without looking their ids up first.
+        RouterOS rejects the whole command if any of them doesn't exist.
+        """
+        api = self._getApi()
+        api.get_resource(path).call('remove', {'numbers': ','.join(names)})
+
+    def getHotspotUsers(self, where: dict[str, str] | None = None) -> list[HotspotUser]:
+        try:
+            users = self.query("/ip/hotspot/user", where, HotspotUser.FIELDS)
 
-            return json.dumps(hosts)
+            return [HotspotUser.fromApi(user) for user in users]
         except exceptions.RouterOsApiConnectionError as err:
-            print(f"Cannot reach RouterOS host: {err}")
-        except exceptions.RouterOsApiConnectionError as err:
-            print(f"Login failed: {err}")
+            log.warning("Cannot reach RouterOS host: %s", err)
+            self._callFailed = True
+        except exceptions.RouterOsApiCommunicationError as err:
+            log.error("RouterOS rejected the hotspot user query: %s", err)
+            self._callFailed = True
 
-    def getHotspotActive(self) -> str:
+    def getHotspotActive(self, where: dict[str, str] | None = None) -> list[ActiveSession]:
         try:
-            api = self._pool.get_api()
+            active = self.query("/ip/hotspot/active", where, ActiveSession.FIELDS)
 
-            active_list = api.get_resource("/ip/hotspot/active")
-            active = active_list.get()
-            
-            return json.dumps(active)
+            return [ActiveSession.fromApi(session) for session in active]
         except exceptions.RouterOsApiConnectionError as err:
-            print(f"Cannot reach RouterOS host: {err}")
-        except exceptions.RouterOsApiConnectionError as err:
-            print(f"Login failed: {err}")
+            log.warning("Cannot reach RouterOS host: %s", err)
+            self._callFailed = True
+        except exceptions.RouterOsApiCommunicationError as err:
+            log.error("RouterOS rejected the active session query: %s", err)
+            self._callFailed = True
 
-    def getHotspotHosts(self) -> str:
+    def getHotspotHosts(self, where: dict[str, str] | None = None) -> list[Host]:
         try:
-            api = self._pool.get_api()
-
-            host_list = api.get_resource("/ip/hotspot/host")
-            hosts = host_list.get()
+            hosts = self.query("/ip/hotspot/host", where, Host.FIELDS)
 
-            return json.dumps(hosts)
-        except exceptions.RouterOsApiConnectionError as err:
-            print(f"Cannot reach RouterOS host: {err}")
+            return [Host.fromApi(host) for host in hosts]
         except exceptions.RouterOsApiConnectionError as err:
-            print(f"Login failed: {err}")
+            log.warning("Cannot reach RouterOS host: %s", err)
+            self._callFailed = True
+        except exceptions.RouterOsApiCommunicationError as err:
+            log.error("RouterOS rejected the hotspot host query: %s", err)
+            self._callFailed = True
+
+    def findHotspotHost(self, mac: str, ip: str) -> Host | None:
+        """
+        Single host lookup; the router returns at most one row instead of the whole table.
+        None if not found or the router is unreachable.
+        """
+        hosts = self.getHotspotHosts({'mac-address': mac, 'address': ip})
+        return hosts[0] if hosts else None
+
+    def findHotspotUser(self, mac: str, ip: str) -> HotspotUser | None:
+        users = self.getHotspotUsers({'mac-address': mac, 'address': ip})
+        return users[0] if users else None
 
     def checkHostConnected(self, mac: str, ip: str):
         try:
-            hosts = self.getHotspotHosts()
-            hosts = json.loads(hosts)
-
-            return any(host["mac-address"] == mac and host["address"] == ip for host in hosts)
+            return bool(self.query("/ip/hotspot/host", {'mac-address': mac, 'address': ip}, ('id',)))
         except:
-            print("Exception: No connected Host of such mac / ip address")
+            log.warning("Exception: No connected Host of such mac / ip address")
+            self._callFailed = True
             return False
 
 
+    @instrumented(ROUTER_CALL_SECONDS, ROUTER_CALL_ERRORS)
     def getRouterInfo(self):
         try:
-            api = self._pool.get_api()
+            api = self._getApi()
 
             system = api.get_resource("/system/resource")
             info = system.get()[0]
-            print(f"Model: {info['board-name']}  OS: {info['version']}")
-            print("Mikrotik connection test successful")
-        except exceptions.RouterOsApiConnectionError as err:
-            print(f"Cannot reach RouterOS host: {err}")
+            log.info("Model: %s  OS: %s", info['board-name'], info['version'])
+            log.info("Mikrotik connection test successful")
         except exceptions.RouterOsApiConnectionError as err:
-            print(f"Login failed: {err}")
-
-    def addHotspotUser(self, mac: str, ip: str, time_minutes: int):
+            log.warning("Cannot reach RouterOS host: %s", err)
+            self._callFailed = True
+        except exceptions.RouterOsApiCommunicationError as err:
+            log.error("RouterOS rejected the resource query: %s", err)
+            self._callFailed = True
+
+    @instrumented(ROUTER_CALL_SECONDS, ROUTER_CALL_ERRORS)
+    def addHotspotUser(self, mac: str, ip: str, time_minutes: int) -> bool:
+        """
+        Create the hotspot account for a paid login. False if the router didn't take it.
+        """
         try:
             command = {
                 "name"         : mac,
@@ -113,35 +204,27 @@ class MikrotikAPI:
                 "profile" : "default"
             }
             
-            api = self._pool.get_api()
+            api = self._getApi()
 
             api.get_resource("/ip/hotspot/user").add(**command)
 
-            print(f"User {mac} added with IP {ip} for {time_minutes} minutes.")
-        except exceptions.RouterOsApiConnectionError as e:
-            print(f"Cannot reach RouterOS host: {e}")
+            log.info("User %s added with IP %s for %d minutes.", mac, ip, time_minutes)
+            return True
         except exceptions.RouterOsApiConnectionError as e:
-            print(f"Login failed: {e}")
+            log.warning("Cannot reach RouterOS host: %s", e)
+            self._callFailed = True
+        except exceptions.RouterOsApiCommunicationError as e:
+            log.error("RouterOS rejected hotspot user %s: %s", mac, e)
+            self._callFailed = True
+        return False
     
     def deleteHotspotUser(self, mac: str):
         try:
-            api = self._pool.get_api()
-
-            hotspot_users = api.get_resource("ip/hotspot/user")
-
-            users = hotspot_users.get(name=mac)
-
-            if not users:
-                print(f"Failed to remove user: User not found")
-
-            uid = users[0]['id']
-            hotspot_users.remove(id=uid)
-            print(f"User {mac} deleted from user accounts")
-        except exceptions.RouterOsApiConnectionError as e:
-            print(f"Cannot reach RouterOS host: {e}")
+            # Users are named after their MAC address, so no id lookup is needed
+            self.removeByName("/ip/hotspot/user", [mac])
+            log.info("User %s deleted from user accounts", mac)
         except exceptions.RouterOsApiConnectionError as e:
-            print(f"Login failed: {e}")
-
-            
-
-
+            log.warning("Cannot reach RouterOS host: %s", e)
+            self._callFailed = True
+        except exceptions.RouterOsApiCommunicationError as e:
+            log.warning("Failed to remove user %s: %s", mac, e)
@@ -0,0 +1,102 @@
+import re
+from dataclasses import dataclass
+from typing import ClassVar
+from functools import lru_cache
+
+# ──────────────────────────── durations ────────────────────────────
+_DURATION_PATTERN = re.compile(r'(\d+)([wdhms])')
+
+_DURATION_UNITS = {
+    'w': 7 * 24 * 60 * 60,
+    'd': 24 * 60 * 60,
+    'h': 60 * 60,
+    'm': 60,
+    's': 1,
+}
+
+@lru_cache(maxsize=4096)
+def parse_mikrotik_time(time_str: str | None) -> int:
+    """Parses MikroTik-style duration strings like '2w3d4h5m6s' into total seconds."""
+    if time_str in (None, "", "never"):
+        return 0
+
+    total_seconds = 0
+    for value, unit in _DURATION_PATTERN.findall(time_str):
+        total_seconds += int(value) * _DURATION_UNITS[unit]
+    return total_seconds
+
+# ──────────────────────────── records ────────────────────────────
+# Rows are converted once when they come off the router. Durations are stored as integer seconds.
+# FIELDS is the .proplist each record is fetched with, so the router only sends what fromApi reads.
+
+@dataclass(slots=True)
+class HotspotUser:
+    FIELDS: ClassVar[tuple[str, ...]] = ('id', 'name', 'mac-address', 'address', 'profile', 'uptime', 'limit-uptime')
+
+    id: str | None
+    name: str | None
+    mac_address: str | None
+    address: str | None
+    profile: str | None
+    uptime: int
+    limit_uptime: int # 0 means no limit
+
+    @classmethod
+    def fromApi(cls, row: dict) -> "HotspotUser":
+        return cls(
+            id=row.get('id'),
+            name=row.get('name'),
+            mac_address=row.get('mac-address'),
+            address=row.get('address'),
+            profile=row.get('profile'),
+            uptime=parse_mikrotik_time(row.get('uptime')),
+            limit_uptime=parse_mikrotik_time(row.get('limit-uptime')),
+        )
+
+    @property
+    def isExpired(self) -> bool:
+        return self.limit_uptime > 0 and self.uptime >= self.limit_uptime
+
+@dataclass(slots=True)
+class ActiveSession:
+    FIELDS: ClassVar[tuple[str, ...]] = ('id', 'user', 'mac-address', 'address', 'uptime', 'session-time-left')
+
+    id: str | None
+    user: str | None
+    mac_address: str | None
+    address: str | None
+    uptime: int
+    session_time_left: int
+
+    @classmethod
+    def fromApi(cls, row: dict) -> "ActiveSession":
+        return cls(
+            id=row.get('id'),
+            user=row.get('user'),
+            mac_address=row.get('mac-address'),
+            address=row.get('address'),
+            uptime=parse_mikrotik_time(row.get('uptime')),
+            session_time_left=parse_mikrotik_time(row.get('session-time-left')),
+        )
+
+@dataclass(slots=True)
+class Host:
+    FIELDS: ClassVar[tuple[str, ...]] = ('id', 'mac-address', 'address', 'to-address', 'authorized', 'bypassed')
+
+    id: str | None
+    mac_address: str | None
+    address: str | None
+    to_address: str | None
+    authorized: bool
+    bypassed: bool
+
+    @classmethod
+    def fromApi(cls, row: dict) -> "Host":
+        return cls(
+            id=row.get('id'),
+            mac_address=row.get('mac-address'),
+            address=row.get('address'),
+            to_address=row.get('to-address'),
+            authorized=row.get('authorized') in (True, 'true', 'yes'),
+            bypassed=row.get('bypassed') in (True, 'true', 'yes'),
+        )
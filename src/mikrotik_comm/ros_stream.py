@@ -0,0 +1,222 @@
+import asyncio
+import itertools
+import logging
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterable
+
+log = logging.getLogger(__name__)
+
+# ──────────────────────────── wire format ────────────────────────────
+def encodeLength(length: int) -> bytes:
+    if length < 0x80:
+        return bytes((length,))
+    if length < 0x4000:
+        return (length | 0x8000).to_bytes(2, 'big')
+    if length < 0x200000:
+        return (length | 0xC00000).to_bytes(3, 'big')
+    if length < 0x10000000:
+        return (length | 0xE0000000).to_bytes(4, 'big')
+    return b'\xF0' + length.to_bytes(4, 'big')
+
+async def readLength(reader: asyncio.StreamReader) -> int:
+    first = (await reader.readexactly(1))[0]
+    if first < 0x80:
+        return first
+    if first < 0xC0:
+        return ((first & 0x3F) << 8) | (await reader.readexactly(1))[0]
+    if first < 0xE0:
+        return ((first & 0x1F) << 16) | int.from_bytes(await reader.readexactly(2), 'big')
+    if first < 0xF0:
+        return ((first & 0x0F) << 24) | int.from_bytes(await reader.readexactly(3), 'big')
+    return int.from_bytes(await reader.readexactly(4), 'big')
+
+async def readSentence(reader: asyncio.StreamReader) -> list[str]:
+    words = []
+    while True:
+        length = await readLength(reader)
+        if length == 0:
+            return words
+        words.append((await reader.readexactly(length)).decode('utf-8', errors='replace'))
+
+def encodeSentence(words: list[str]) -> bytes:
+    out = bytearray()
+    for word in words:
+        data = word.encode('utf-8')
+        out += encodeLength(len(data)) + data
+    out += b'\x00'
+    return bytes(out)
+
+def parseReply(words: list[str]) -> tuple[str, str | None, dict]:
+    """
+    Split a reply sentence into its type (!re, !done, ...), tag and attributes. '.id' is
+    returned as 'id' and '.dead' as 'dead', like routeros_api does for the models.
+    """
+    reply, tag, attributes = words[0], None, {}
+    for word in words[1:]:
+        if word.startswith('.tag='):
+            tag = word[5:]
+        elif word.startswith('='):
+            key, _, value = word[1:].partition('=')
+            attributes[key[1:] if key in ('.id', '.dead') else key] = value
+    return reply, tag, attributes
+
+# ──────────────────────────── client ────────────────────────────
+class RouterOsTrap(Exception):
+    """The router answered a command with !trap or !fatal."""
+
+@dataclass(slots=True)
+class Change:
+    kind: str # 'add', 'update', 'remove', or 'synced' once the initial rows have all been sent
+    path: str
+    id: str | None
+    row: dict | None
+
+class RouterOsStream:
+    """
+    Asyncio-native RouterOS API connection for long-running commands.
+
+    routeros_api blocks a thread per command and can't stream, so subscriptions get this
+    separate connection. Commands are multiplexed by .tag; every subscription is one
+    `listen` that stays open until it's cancelled or the connection drops.
+    """
+    def __init__(self, host: str, username: str, password: str, port: int = 8728, timeout: float = 10.0):
+        self._host = host
+        self._username = username
+        self._password = password
+        self._port = int(port)
+        self._timeout = timeout
+
+        self._tags = itertools.count(1)
+        self._replies: dict[str, asyncio.Queue] = {}
+        self._writer = None
+        self._reader_task = None
+        self._connect_lock = asyncio.Lock()
+
+    @property
+    def connected(self) -> bool:
+        return self._reader_task is not None and not self._reader_task.done()
+
+    async def connect(self):
+        async with self._connect_lock:
+            if self.connected:
+                return
+
+            try:
+                reader, self._writer = await asyncio.wait_for(
+                    asyncio.open_connection(self._host, self._port), self._timeout)
+                self._reader_task = asyncio.create_task(self._readReplies(reader))
+
+                # Plaintext login, like the MikrotikAPI pool
+                await asyncio.wait_for(
+                    self.request('/login', {'name': self._username or '', 'password': self._password or ''}),
+                    self._timeout)
+            except BaseException:
+                # Refused, timed out or cancelled: don't leave a half-open stream looking connected
+                await self.close()
+                raise
+
+    async def close(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            await asyncio.gather(self._reader_task, return_exceptions=True)
+            self._reader_task = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _send(self, command: str, attributes: dict | None = None, queries: dict | None = None) -> tuple[str, asyncio.Queue]:
+        if not self.connected:
+            raise ConnectionError("RouterOS stream is not connected")
+
+        tag = str(next(self._tags))
+        replies = self._replies[tag] = asyncio.Queue()
+        words = [command]
+        words += [f'={key}={value}' for key, value in (attributes or {}).items()]
+        words += [f'?{key}={value}' for key, value in (queries or {}).items()]
+        words.append(f'.tag={tag}')
+        self._writer.write(encodeSentence(words))
+        return tag, replies
+
+    async def _readReplies(self, reader: asyncio.StreamReader):
+        error = ConnectionError("RouterOS stream closed")
+        try:
+            while True:
+                reply, tag, attributes = parseReply(await readSentence(reader))
+                replies = self._replies.get(tag)
+                if replies is not None:
+                    replies.put_nowait((reply, attributes))
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            error = ConnectionError(f"RouterOS stream lost: {e!r}")
+        finally:
+            # Wake everybody still waiting on a reply
+            for replies in self._replies.values():
+                replies.put_nowait(('!error', error))
+            self._replies.clear()
+
+    async def _next(self, replies: asyncio.Queue) -> tuple[str, dict]:
+        reply, attributes = await replies.get()
+        if reply == '!error':
+            raise attributes
+        if reply in ('!trap', '!fatal'):
+            raise RouterOsTrap(attributes.get('message', reply))
+        return reply, attributes
+
+    async def request(self, command: str, attributes: dict | None = None, queries: dict | None = None) -> list[dict]:
+        """Run a command and return its !re rows."""
+        tag, replies = self._send(command, attributes, queries)
+        rows = []
+        try:
+            while True:
+                reply, row = await self._next(replies)
+                if reply == '!done':
+                    return rows
+                if reply == '!re':
+                    rows.append(row)
+        finally:
+            self._replies.pop(tag, None)
+
+    def _cancel(self, tag: str):
+        self._replies.pop(tag, None)
+        if self.connected:
+            self._writer.write(encodeSentence(['/cancel', f'=tag={tag}', f'.tag={next(self._tags)}']))
+
+    async def watch(self, path: str, fields: Iterable[str] | None = None) -> AsyncIterator[Change]:
+        """
+        Follow a table: an 'add' per existing row, one 'synced', then every change as it happens.
+        Rows carry only `fields` (all attributes if None). Raises ConnectionError when the
+        connection drops; call it again after reconnecting for a fresh snapshot.
+        """
+        await self.connect()
+        fields = tuple(fields) if fields else None
+
+        def project(row: dict) -> dict:
+            return row if fields is None else {key: row[key] for key in fields if key in row}
+
+        # Listen before printing so nothing that changes during the print is missed;
+        # those events are queued and applied on top of the snapshot
+        tag, changes = self._send(f'{path}/listen')
+        try:
+            proplist = {'.proplist': ','.join('.id' if field == 'id' else field for field in fields)} if fields else None
+            known = set()
+            for row in await self.request(f'{path}/print', proplist):
+                known.add(row.get('id'))
+                yield Change('add', path, row.get('id'), project(row))
+            yield Change('synced', path, None, None)
+
+            while True:
+                reply, row = await self._next(changes)
+                if reply == '!done':
+                    return
+                if reply != '!re':
+                    continue
+
+                row_id = row.get('id')
+                if row.get('dead') in ('true', 'yes'):
+                    known.discard(row_id)
+                    yield Change('remove', path, row_id, None)
+                else:
+                    kind = 'update' if row_id in known else 'add'
+                    known.add(row_id)
+                    yield Change(kind, path, row_id, project(row))
+        finally:
+            self._cancel(tag)
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Iterable
+
+from mikrotik_comm.async_mikrotik import AsyncMikrotikAPI
+from mikrotik_comm.models import HotspotUser
+from metrics.registry import REGISTRY, WORKER_LOOP_SECONDS
+
+log = logging.getLogger(__name__)
+
+USERS_REAPED = REGISTRY.counter(
+    'koinet_hotspot_users_reaped_total', 'Exhausted hotspot accounts removed from the router')
+
+class UserReaper:
+    """
+    Removes hotspot accounts whose uptime reached their limit, off the login path.
+
+    Each pass takes the exhausted accounts from `users()` (the hotspot feed's mirror), re-reads
+    their counters in one pass over the router's table, since the mirror's uptime can be a minute
+    old, and removes the ones still exhausted by name in batches, one round trip per batch. Only accounts the kiosk created
+    are touched: they are named after their MAC address.
+    """
+    EXPIRY_FIELDS = ('name', 'mac-address', 'uptime', 'limit-uptime')
+
+    def __init__(self, api: AsyncMikrotikAPI, users: Callable[[], Iterable[HotspotUser]],
+                 interval: float = 60.0, batch_size: int = 100):
+        self._api = api
+        self._users = users
+        self._interval = interval
+        self._batch_size = batch_size
+
+        # Statistics
+        self.runs = 0
+        self.reaped = 0
+        self.errors = 0
+        self.lastRunAt = None
+
+    def stats(self) -> dict:
+        return {
+            'runs': self.runs,
+            'reaped': self.reaped,
+            'errors': self.errors,
+        }
+
+    def expired(self) -> list[str]:
+        return [user.name for user in self._users()
+                if user.isExpired and user.name is not None and user.name == user.mac_address]
+
+    async def confirmExpired(self, names: list[str]) -> list[str]:
+        """
+        The accounts among `names` that the router itself reports as exhausted right now, from one
+        download of the table's counters. One recreated with a fresh limit since the mirror saw it
+        is left alone. Raises if the router is unreachable.
+        """
+        wanted = set(names)
+        rows = await self._api.query('/ip/hotspot/user', None, self.EXPIRY_FIELDS)
+        users = (HotspotUser.fromApi(row) for row in rows)
+        return [user.name for user in users
+                if user.name in wanted and user.isExpired and user.name == user.mac_address]
+
+    async def reap(self, names: list[str]) -> int:
+        """
+        Remove the named accounts and return how many are gone.
+        """
+        removed = 0
+        for i in range(0, len(names), self._batch_size):
+            batch = names[i:i + self._batch_size]
+            try:
+                await self._api.removeByName('/ip/hotspot/user', batch)
+                removed += len(batch)
+                continue
+            except Exception as e:
+                # The router rejects the whole batch if one name is already gone
+                log.debug("Batch remove of %d users failed, removing one by one: %s", len(batch), e)
+
+            for name in batch:
+                try:
+                    await self._api.removeByName('/ip/hotspot/user', [name])
+                    removed += 1
+                except Exception as e:
+                    if 'no such item' in str(e):
+                        continue # Already removed by someone else
+                    self.errors += 1
+                    log.warning("Failed to remove expired user %s: %s", name, e)
+
+        self.reaped += removed
+        USERS_REAPED.inc(amount=removed)
+        return removed
+
+    async def runOnce(self) -> int:
+        names = self.expired()
+        if names:
+            names = await self.confirmExpired(names)
+        removed = await self.reap(names) if names else 0
+        if removed:
+            log.info("Removed %d expired hotspot users", removed)
+
+        self.runs += 1
+        self.lastRunAt = time.time()
+        return removed
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self._interval)
+            try:
+                with WORKER_LOOP_SECONDS.time('user_reaper'):
+                    await self.runOnce()
+            except Exception as e:
+                self.errors += 1
+                log.warning("Expired user pass failed: %s", e)
@@ -0,0 +1,129 @@
+import ipaddress
+import re
+import time
+from collections import OrderedDict
+
+_MAC = re.compile(r'[0-9A-Fa-f]{2}(:[0-9A-Fa-f]{2}){5}')
+
+def parseLoginRequest(data: str) -> tuple[str, str] | None:
+    """
+    The (mac, ip) a portal page sends as its first message, or None if it isn't 'mac,ip'.
+    """
+    mac_address, _, ip_address = data.strip().partition(',')
+    if not _MAC.fullmatch(mac_address):
+        return None
+    try:
+        ipaddress.ip_address(ip_address)
+    except ValueError:
+        return None
+    return mac_address, ip_address
+
+def clientAddress(peer: str | None, forwarded_for: str | None, trusted_proxies: frozenset[str]) -> str | None:
+    """
+    The address to rate limit a connection by. Behind a trusted proxy (a local tunnel like
+    cloudflared) the peer is shared by every client, so the nearest untrusted X-Forwarded-For
+    entry is used instead, or None when the proxy didn't say.
+    """
+    if peer not in trusted_proxies:
+        return peer
+
+    for address in reversed((forwarded_for or '').split(',')):
+        address = address.strip()
+        if address and address not in trusted_proxies:
+            return address
+    return None
+
+class TokenBucket:
+    """
+    Classic token bucket: holds up to `burst` tokens and refills at `rate` tokens per second.
+    """
+    __slots__ = ('tokens', 'updatedAt')
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.updatedAt = now
+
+    def take(self, rate: float, burst: float, now: float) -> bool:
+        self.tokens = min(burst, self.tokens + (now - self.updatedAt) * rate)
+        self.updatedAt = now
+
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+class RateLimiter:
+    """
+    One token bucket per key (MAC or IP address). Only the `max_keys` most recently seen keys are
+    tracked, so a flood of spoofed addresses can't grow it without bound; a key that was evicted
+    simply starts again with a full bucket.
+    """
+    def __init__(self, rate: float, burst: float, max_keys: int = 4096):
+        self._rate = rate
+        self._burst = burst
+        self._max_keys = max_keys
+        self._buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+
+    def allow(self, key: str, now: float | None = None) -> bool:
+        now = time.monotonic() if now is None else now
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self._burst, now)
+            if len(self._buckets) > self._max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+
+        return bucket.take(self._rate, self._burst, now)
+
+class AdmissionControl:
+    """
+    Cheap checks run before a login request is allowed to cost any router or database work:
+    a global cap on concurrent login sockets and token-bucket rate limits per client IP and MAC.
+    """
+    def __init__(self, max_concurrent: int = 64, rate: float = 0.5, burst: float = 5):
+        self._max_concurrent = max_concurrent
+        self._perIp = RateLimiter(rate, burst)
+        self._perMac = RateLimiter(rate, burst)
+
+        self.active = 0
+
+        # Statistics
+        self.admitted = 0
+        self.rejected = {'busy': 0, 'ip': 0, 'mac': 0}
+
+    def admit(self, ip: str | None) -> str | None:
+        """
+        Take a concurrency slot for a new connection. Returns None when admitted, otherwise the
+        reason it was turned away. Every admitted connection must call release() once. `ip` is
+        None when the client's address is unknown, which skips the per-IP limit.
+        """
+        if self.active >= self._max_concurrent:
+            self.rejected['busy'] += 1
+            return 'busy'
+
+        if ip is not None and not self._perIp.allow(ip):
+            self.rejected['ip'] += 1
+            return 'rate limited'
+
+        self.active += 1
+        self.admitted += 1
+        return None
+
+    def allowMac(self, mac: str) -> bool:
+        if self._perMac.allow(mac):
+            return True
+
+        self.rejected['mac'] += 1
+        return False
+
+    def release(self):
+        self.active -= 1
+
+    def stats(self) -> dict:
+        return {
+            'active': self.active,
+            'admitted': self.admitted,
+            'rejected': dict(self.rejected),
+        }
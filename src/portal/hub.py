@@ -0,0 +1,172 @@
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+def encode(message) -> str:
+    return json.dumps(message, separators=(',', ':'))
+
+class ClientChannel:
+    """
+    Outbound side of one websocket: a small bounded queue drained by its own task.
+
+    Messages sent with a `kind` supersede a queued message of the same kind, so a client that
+    falls behind only ever gets the latest position or timer tick instead of a backlog. A
+    client whose queue overflows or whose socket doesn't accept a frame within `send_timeout`
+    seconds is dropped, which never holds up anybody else.
+    """
+    def __init__(self, websocket, max_queue: int = 8, send_timeout: float = 5.0, on_drop=None):
+        self.websocket = websocket
+        self._max_queue = max_queue
+        self._send_timeout = send_timeout
+        self._on_drop = on_drop
+
+        self._pending: OrderedDict[object, str] = OrderedDict()
+        self._seq = 0
+        self._ready = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+        self.closed = False
+
+        # Statistics
+        self.sent = 0
+        self.superseded = 0
+
+        self._task = asyncio.create_task(self._drain())
+
+    def __len__(self):
+        return len(self._pending)
+
+    def send(self, text: str, kind: str | None = None) -> bool:
+        """
+        Queue an encoded message without waiting. Returns False if the client is gone.
+        """
+        if self.closed:
+            return False
+
+        if kind is not None and kind in self._pending:
+            self._pending[kind] = text
+            self.superseded += 1
+            return True
+
+        if len(self._pending) >= self._max_queue:
+            self._drop("send queue full")
+            return False
+
+        if kind is None:
+            kind = self._seq # Ints never collide with the string kinds
+            self._seq += 1
+
+        self._pending[kind] = text
+        self._idle.clear()
+        self._ready.set()
+        return True
+
+    async def flush(self, timeout: float):
+        """
+        Wait up to `timeout` seconds for everything queued to be sent.
+        """
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def close(self):
+        self.closed = True
+        self._pending.clear()
+        self._idle.set()
+        if self._task is not asyncio.current_task():
+            self._task.cancel()
+
+    async def _drain(self):
+        while True:
+            while not self._pending:
+                self._idle.set()
+                self._ready.clear()
+                await self._ready.wait()
+
+            _, text = self._pending.popitem(last=False)
+            try:
+                await asyncio.wait_for(self.websocket.send_text(text), self._send_timeout)
+            except asyncio.TimeoutError:
+                self._drop(f"no progress for {self._send_timeout}s")
+                return
+            except Exception as e:
+                self._drop(f"send failed: {e}")
+                return
+
+            self.sent += 1
+
+    def _drop(self, reason: str):
+        if self.closed:
+            return
+
+        log.info("Dropping websocket client: %s", reason)
+        self.close()
+        if self._on_drop is not None:
+            self._on_drop(self)
+        self._closing = asyncio.create_task(self._closeSocket())
+
+    async def _closeSocket(self):
+        try:
+            await asyncio.wait_for(self.websocket.close(code=4008, reason="Client too slow"), 1.0)
+        except Exception:
+            pass # Already gone or stuck, the server reaps it either way
+
+class BroadcastHub:
+    """
+    Fan-out to the portal's websockets. Sending only queues on the client's channel, so the
+    cost of a broadcast is bounded by the number of clients, not by the slowest of them.
+    """
+    def __init__(self, max_queue: int = 8, send_timeout: float = 5.0):
+        self._max_queue = max_queue
+        self._send_timeout = send_timeout
+
+        # Keyed by id(); Starlette websockets compare like mappings and aren't hashable
+        self._channels: dict[int, ClientChannel] = {}
+
+        # Statistics
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._channels)
+
+    def register(self, websocket) -> ClientChannel:
+        channel = ClientChannel(websocket, self._max_queue, self._send_timeout, on_drop=self._dropped)
+        self._channels[id(websocket)] = channel
+        return channel
+
+    async def unregister(self, websocket, flush_timeout: float = 2.0):
+        """
+        Forget a client, first giving already queued messages `flush_timeout` seconds to go out.
+        """
+        channel = self._channels.pop(id(websocket), None)
+        if channel is None:
+            return
+
+        if flush_timeout > 0:
+            await channel.flush(flush_timeout)
+        channel.close()
+
+    def _dropped(self, channel: ClientChannel):
+        self.dropped += 1
+
+    def send(self, websocket, message, kind: str | None = None) -> bool:
+        """
+        Queue `message` (a dict, or text already encoded) for one client.
+        """
+        channel = self._channels.get(id(websocket))
+        if channel is None:
+            return False
+
+        return channel.send(message if isinstance(message, str) else encode(message), kind)
+
+    def stats(self) -> dict:
+        return {
+            'clients': len(self._channels),
+            'pending': sum(len(channel) for channel in self._channels.values()),
+            'dropped': self.dropped,
+        }
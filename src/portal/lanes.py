@@ -0,0 +1,116 @@
+import asyncio
+import logging
+
+from arduino.arduino_serial import ArduinoSerial
+from portal.waiting_room import WaitingRoom
+
+log = logging.getLogger(__name__)
+
+class CoinSession:
+    """
+    Coins credited to one customer on one lane.
+
+    The Arduino reports a running total that is reset between customers, and the reset lands
+    asynchronously. Counting only increases between observations keeps one customer's coins from
+    leaking into the next session no matter when the reset arrives.
+
+    A session restored after a restart starts from its checkpointed `coins` and `last_seen`, so
+    coins the Arduino counted while the service was down are credited once its first frame arrives.
+    """
+    def __init__(self, arduino: ArduinoSerial, coins: int = 0, last_seen: int | None = None):
+        self._arduino = arduino
+        if last_seen is None and arduino.lastFrameAt is not None:
+            last_seen = arduino.coinCount
+        self._lastSeen = last_seen # None until the Arduino has reported a count
+        self.coins = coins
+
+    @property
+    def lastSeen(self) -> int | None:
+        return self._lastSeen
+
+    def observe(self, coin_count: int) -> bool:
+        """
+        Account for the acceptor's current count. Returns True if new coins were credited.
+        """
+        if self._arduino.lastFrameAt is None:
+            return False # No frame since startup, the count is a placeholder
+        if self._lastSeen is None:
+            self._lastSeen = coin_count # First real count is the baseline
+            return False
+
+        credited = coin_count > self._lastSeen
+        if credited:
+            self.coins += coin_count - self._lastSeen
+        self._lastSeen = coin_count
+
+        return credited
+
+class LoginLane:
+    """
+    One coin acceptor and the customer it is currently serving.
+    """
+    def __init__(self, index: int, arduino: ArduinoSerial):
+        self.index = index
+        self.arduino = arduino
+        self.session: CoinSession | None = None
+        self.item = None
+
+    @property
+    def busy(self) -> bool:
+        return self.item is not None
+
+class LaneDispatcher:
+    """
+    Hands the head of the waiting room to the first free lane.
+
+    `serve(lane, item)` runs one customer's whole coin window on that lane. Lanes work
+    independently, so N acceptors serve N customers at once.
+    """
+    def __init__(self, waiting_room: WaitingRoom, lanes: list[LoginLane], serve):
+        self._room = waiting_room
+        self._lanes = lanes
+        self._serve = serve
+        self._laneFreed = asyncio.Event()
+        self._serving: set[asyncio.Task] = set()
+
+    def _firstFreeLane(self) -> LoginLane | None:
+        return next((lane for lane in self._lanes if not lane.busy), None)
+
+    def resume(self, lane: LoginLane, item, coins: int, last_seen: int):
+        """
+        Continue a coin window that was in progress on `lane` before a restart.
+        """
+        self._start(lane, item, CoinSession(lane.arduino, coins, last_seen))
+
+    def _start(self, lane: LoginLane, item, session: CoinSession):
+        lane.item = item
+        lane.session = session
+        task = asyncio.create_task(self._serveOn(lane, item))
+        self._serving.add(task)
+        task.add_done_callback(self._serving.discard)
+
+    async def run(self):
+        try:
+            while True:
+                while self._firstFreeLane() is None:
+                    self._laneFreed.clear()
+                    await self._laneFreed.wait()
+
+                item = await self._room.next()
+                lane = self._firstFreeLane()
+                self._start(lane, item, CoinSession(lane.arduino))
+        finally:
+            # Shutting down: stop the coin windows too, before the clients they use are closed
+            for task in list(self._serving):
+                task.cancel()
+            await asyncio.gather(*self._serving, return_exceptions=True)
+
+    async def _serveOn(self, lane: LoginLane, item):
+        try:
+            await self._serve(lane, item)
+        except Exception as e:
+            log.exception("Lane %d failed serving %s: %s", lane.index, getattr(item, 'mac_address', item), e)
+        finally:
+            lane.item = None
+            lane.session = None
+            self._laneFreed.set()
@@ -0,0 +1,130 @@
+import asyncio
+from collections import OrderedDict
+
+class WaitingRoom:
+    """
+    Ordered waiting line for the login kiosk, keyed by the client's MAC address.
+
+    Joining, leaving from anywhere in the line and taking the head are all O(1). Positions are
+    kept as ranks relative to the head, so a head dequeue doesn't touch any other member; a
+    removal from the middle just marks the ranks stale and they are rebuilt on the next lookup.
+    """
+    def __init__(self):
+        self._members: OrderedDict[str, object] = OrderedDict()
+        self._rank: dict[str, int] = {}
+        self._headRank = 0
+        self._nextRank = 0
+        self._ranksStale = False
+
+        # Last position each member was told about, so broadcasts only go to members that moved
+        self._announced: dict[str, int] = {}
+
+        self._notEmpty = asyncio.Event()
+
+    def __len__(self):
+        return len(self._members)
+
+    def __contains__(self, key: str):
+        return key in self._members
+
+    def __iter__(self):
+        """Members from the head of the line to the back."""
+        return iter(self._members.values())
+
+    def get(self, key: str):
+        return self._members.get(key)
+
+    def add(self, key: str, item) -> int:
+        """
+        Append a member to the back of the line and return its 1-based position.
+        """
+        if key in self._members:
+            raise ValueError(f"{key} is already waiting")
+
+        self._members[key] = item
+        self._rank[key] = self._nextRank
+        self._nextRank += 1
+        self._notEmpty.set()
+
+        return self.position(key)
+
+    def remove(self, key: str):
+        """
+        Take a member out of the line wherever it is, e.g. when its websocket disconnects.
+        """
+        item = self._members.pop(key, None)
+        if item is None:
+            return None
+
+        rank = self._rank.pop(key)
+        self._announced.pop(key, None)
+
+        if rank == self._headRank and not self._ranksStale:
+            self._headRank += 1
+        elif self._members:
+            self._ranksStale = True
+
+        return item
+
+    def reannounce(self, key: str):
+        """
+        Include a member in the next changedPositions() again, e.g. after it reconnected on a new socket.
+        """
+        self._announced.pop(key, None)
+
+    def popNext(self):
+        """
+        Take the member at the head of the line without waiting. Returns None when nobody is waiting.
+        """
+        if not self._members:
+            return None
+
+        key = next(iter(self._members))
+        return self.remove(key)
+
+    async def next(self):
+        """
+        Wait until somebody is in line and take the head.
+        """
+        while not self._members:
+            self._notEmpty.clear()
+            await self._notEmpty.wait()
+
+        return self.popNext()
+
+    def _rebuildRanks(self):
+        self._rank = {key: rank for rank, key in enumerate(self._members)}
+        self._headRank = 0
+        self._nextRank = len(self._members)
+        self._ranksStale = False
+
+    def position(self, key: str) -> int | None:
+        """
+        1-based position of a member, or None if it is not waiting.
+        """
+        rank = self._rank.get(key)
+        if rank is None:
+            return None
+
+        if self._ranksStale:
+            self._rebuildRanks()
+            rank = self._rank[key]
+
+        return rank - self._headRank + 1
+
+    def changedPositions(self) -> list[tuple[object, int]]:
+        """
+        Members whose position differs from the one they were last told, paired with the new position.
+        Calling this marks those positions as announced.
+        """
+        if self._ranksStale:
+            self._rebuildRanks()
+
+        changed = []
+        for key, item in self._members.items():
+            position = self._rank[key] - self._headRank + 1
+            if self._announced.get(key) != position:
+                self._announced[key] = position
+                changed.append((item, position))
+
+        return changed
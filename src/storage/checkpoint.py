@@ -0,0 +1,121 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Callable
+
+log = logging.getLogger(__name__)
+
+class Checkpoint:
+    """
+    Periodic snapshot of in-flight runtime state (the waiting line, coin sessions) so a restart
+    can pick up where the previous process stopped.
+
+    `snapshot()` returns a JSON-able dict and is taken on the event loop. It is written as one
+    compact JSON document to a temp file that is fsynced and renamed over the old one, on a worker
+    thread so a slow SD card never stalls the loop; a crash mid-write leaves the previous
+    checkpoint intact. An unchanged snapshot is only rewritten every `keepalive` seconds, to keep
+    its timestamp fresh, so an idle kiosk costs next to no SD card writes.
+    """
+    VERSION = 1
+
+    def __init__(self, path: str, snapshot: Callable[[], dict], interval: float = 1.0, keepalive: float = 60.0):
+        self._path = path
+        self._snapshot = snapshot
+        self._interval = interval
+        self._keepalive = keepalive
+        self._last = None
+        self._frozen = False
+        self._lock = asyncio.Lock() # One write at a time, in the order the snapshots were taken
+
+        # Statistics
+        self.saves = 0
+        self.errors = 0
+        self.lastSavedAt = None
+
+    def stats(self) -> dict:
+        return {
+            'saves': self.saves,
+            'errors': self.errors,
+            'lastSaveAge': None if self.lastSavedAt is None else round(time.monotonic() - self.lastSavedAt, 1),
+        }
+
+    def load(self, max_age: float) -> dict | None:
+        """
+        The saved state if it was written less than `max_age` seconds ago, else None.
+        """
+        try:
+            with open(self._path, 'r') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            log.error("Failed to read checkpoint %s: %s", self._path, e)
+            return None
+
+        if state.get('version') != self.VERSION:
+            log.warning("Ignoring checkpoint %s with version %s", self._path, state.get('version'))
+            return None
+
+        age = time.time() - state.get('savedAt', 0)
+        if not 0 <= age < max_age:
+            log.info("Ignoring checkpoint from %.0fs ago", age)
+            return None
+        return state
+
+    async def save(self, force: bool = False):
+        """
+        Write the current snapshot now if it changed (or `force`). Does nothing once frozen.
+        """
+        async with self._lock:
+            if not self._frozen:
+                await self._save(force)
+
+    async def _save(self, force: bool):
+        try:
+            state = self._snapshot()
+            data = json.dumps(state, separators=(',', ':'))
+        except Exception as e:
+            self.errors += 1
+            log.exception("Failed to build checkpoint: %s", e)
+            return
+        if data == self._last and not force and time.monotonic() - self.lastSavedAt < self._keepalive:
+            return
+
+        document = json.dumps({'version': self.VERSION, 'savedAt': round(time.time(), 3), **state},
+                              separators=(',', ':')).encode()
+
+        try:
+            await asyncio.to_thread(self._write, document)
+        except OSError as e:
+            self.errors += 1
+            log.error("Failed to write checkpoint %s: %s", self._path, e)
+            return
+
+        self._last = data
+        self.saves += 1
+        self.lastSavedAt = time.monotonic()
+
+    def _write(self, document: bytes):
+        tmp_path = self._path + '.tmp'
+        os.makedirs(os.path.dirname(self._path) or '.', exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            f.write(document)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._path)
+
+    async def freeze(self):
+        """
+        Write a last snapshot and ignore saves from then on, e.g. from tasks being cancelled at shutdown.
+        """
+        async with self._lock:
+            if not self._frozen:
+                await self._save(force=True)
+                self._frozen = True
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self._interval)
+            await self.save()
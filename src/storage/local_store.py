@@ -0,0 +1,258 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+log = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id          INTEGER PRIMARY KEY,
+    key         TEXT NOT NULL UNIQUE,
+    mac         TEXT NOT NULL,
+    ip          TEXT,
+    lane        INTEGER,
+    started_at  REAL NOT NULL,
+    ended_at    REAL NOT NULL,
+    coins       INTEGER NOT NULL,
+    minutes     INTEGER NOT NULL,
+    outcome     TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS coin_inserts (
+    id      INTEGER PRIMARY KEY,
+    mac     TEXT NOT NULL,
+    coins   INTEGER NOT NULL,
+    at      REAL NOT NULL,
+    day     TEXT NOT NULL,
+    hour    TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS coin_inserts_day ON coin_inserts (day);
+CREATE TABLE IF NOT EXISTS coin_baseline (
+    day     TEXT NOT NULL,
+    kind    TEXT NOT NULL, -- 'user', 'hour' or 'day': counted before this database existed
+    key     TEXT NOT NULL,
+    coins   INTEGER NOT NULL,
+    PRIMARY KEY (day, kind, key)
+);
+CREATE TABLE IF NOT EXISTS telemetry (
+    resolution  TEXT NOT NULL,
+    start       REAL NOT NULL,
+    min_power   REAL NOT NULL,
+    max_power   REAL NOT NULL,
+    avg_power   REAL NOT NULL,
+    wh          REAL NOT NULL,
+    PRIMARY KEY (resolution, start)
+);
+CREATE TABLE IF NOT EXISTS outbox (
+    id      INTEGER PRIMARY KEY AUTOINCREMENT, -- ids must never be reused after replicated rows are pruned
+    path    TEXT NOT NULL,
+    value   TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    name    TEXT PRIMARY KEY,
+    last_id INTEGER NOT NULL
+);
+"""
+
+class LocalStore:
+    """
+    Embedded SQLite (WAL mode) source of truth for sessions, coin inserts and telemetry.
+
+    Writes are queued and committed in batches by a single writer thread. Every record that has
+    to reach Firebase also appends its writes to the `outbox` table in the same transaction, so
+    a replicator can stream them out later and nothing is lost while the uplink is down.
+    Reads use their own connection and never wait for the writer.
+    """
+    def __init__(self, path: str, commit_interval: float = 0.5, max_batch: int = 500):
+        self._path = path
+        self._commit_interval = commit_interval
+        self._max_batch = max_batch
+
+        self._writes: queue.Queue = queue.Queue()
+        self._stopping = threading.Event()
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        writer = self._connect()
+        writer.executescript(_SCHEMA)
+        writer.commit()
+        self._writer = writer
+
+        self._reader = self._connect()
+        self._readLock = threading.Lock()
+
+        self._thread = threading.Thread(target=self._run, name="local-store", daemon=True)
+        self._thread.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self._path, check_same_thread=False, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL") # Durable enough with WAL, far fewer fsyncs on the SD card
+        connection.execute("PRAGMA busy_timeout=5000")
+        return connection
+
+    def close(self):
+        self._stopping.set()
+        self._writes.put(None)
+        self._thread.join(5)
+        self._writer.close()
+        self._reader.close()
+
+    # ──────────────────────────── writer thread ────────────────────────────
+    def _run(self):
+        while True:
+            item = self._writes.get()
+            batch = [item]
+
+            # Gather whatever else arrives within the commit interval into the same transaction
+            deadline = time.monotonic() + self._commit_interval
+            while len(batch) < self._max_batch and item is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._writes.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+
+            self._commit([op for op in batch if op is not None])
+
+            if None in batch:
+                return
+
+    def _commit(self, batch: list):
+        if not batch:
+            return
+
+        try:
+            self._writer.execute("BEGIN")
+            for operation in batch:
+                if isinstance(operation, threading.Event):
+                    continue
+                for sql, params in operation:
+                    self._writer.execute(sql, params)
+            self._writer.execute("COMMIT")
+        except sqlite3.Error as e:
+            log.error("Failed to commit %d local store writes: %s", len(batch), e)
+            try:
+                self._writer.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+        finally:
+            for operation in batch:
+                if isinstance(operation, threading.Event):
+                    operation.set()
+
+    def _submit(self, statements: list[tuple[str, tuple]]):
+        if self._stopping.is_set():
+            log.warning("Local store is closed, dropping write")
+            return
+        self._writes.put(statements)
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """
+        Block until everything submitted so far is committed.
+        """
+        done = threading.Event()
+        self._writes.put(done)
+        return done.wait(timeout)
+
+    @staticmethod
+    def _outbox(writes: list[tuple[str, object]]) -> list[tuple[str, tuple]]:
+        return [("INSERT INTO outbox (path, value) VALUES (?, ?)", (path, json.dumps(value))) for path, value in writes]
+
+    # ──────────────────────────── records ────────────────────────────
+    def recordSession(self, key: str, mac: str, ip: str, lane: int, started_at: float, ended_at: float,
+                      coins: int, minutes: int, outcome: str, replicate: list[tuple[str, object]] = ()):
+        self._submit([
+            ("INSERT OR REPLACE INTO sessions (key, mac, ip, lane, started_at, ended_at, coins, minutes, outcome) "
+             "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+             (key, mac, ip, lane, started_at, ended_at, coins, minutes, outcome)),
+            *self._outbox(replicate),
+        ])
+
+    def recordCoins(self, mac: str, coins: int, when: datetime, replicate: list[tuple[str, object]] = ()):
+        self._submit([
+            ("INSERT INTO coin_inserts (mac, coins, at, day, hour) VALUES (?, ?, ?, ?, ?)",
+             (mac, coins, when.timestamp(), when.date().isoformat(), f'{when.hour:02d}')),
+            *self._outbox(replicate),
+        ])
+
+    def recordCoinBaseline(self, day: str, totals: dict):
+        """
+        Store coin totals for `day` (ISO date) counted elsewhere, e.g. already in Firebase when
+        this database was created; coinTotals() adds them to the inserts.
+        """
+        rows = [('user', user, count) for user, count in totals['users'].items()]
+        rows += [('hour', hour, count) for hour, count in totals['hourly'].items()]
+        rows.append(('day', '', totals['total']))
+        self._submit([("INSERT OR REPLACE INTO coin_baseline (day, kind, key, coins) VALUES (?, ?, ?, ?)",
+                       (day, kind, key, count)) for kind, key, count in rows])
+
+    def recordRollup(self, resolution: str, bucket: dict, replicate: list[tuple[str, object]] = ()):
+        self._submit([
+            ("INSERT OR REPLACE INTO telemetry (resolution, start, min_power, max_power, avg_power, wh) "
+             "VALUES (?, ?, ?, ?, ?, ?)",
+             (resolution, bucket['start'], bucket['min'], bucket['max'], bucket['avg'], bucket['wh'])),
+            *self._outbox(replicate),
+        ])
+
+    def prune(self, sessions_before: float, coins_before: str, telemetry_before: dict[str, float]):
+        """
+        Drop history past its retention window: sessions started before `sessions_before`, coin
+        inserts of days before `coins_before` (ISO date) and rollups per resolution that start
+        before the given time. Committed by the writer thread like any other write.
+        """
+        statements = [
+            ("DELETE FROM sessions WHERE started_at < ?", (sessions_before,)),
+            ("DELETE FROM coin_inserts WHERE day < ?", (coins_before,)),
+            ("DELETE FROM coin_baseline WHERE day < ?", (coins_before,)),
+        ]
+        statements += [("DELETE FROM telemetry WHERE resolution = ? AND start < ?", (resolution, before))
+                       for resolution, before in telemetry_before.items()]
+        self._submit(statements)
+
+    def setCheckpoint(self, name: str, last_id: int):
+        self._submit([
+            ("INSERT INTO checkpoints (name, last_id) VALUES (?, ?) "
+             "ON CONFLICT(name) DO UPDATE SET last_id = excluded.last_id", (name, last_id)),
+            # Replicated rows are no longer needed
+            ("DELETE FROM outbox WHERE id <= ?", (last_id,)),
+        ])
+
+    # ──────────────────────────── reads ────────────────────────────
+    def _query(self, sql: str, params: tuple = ()) -> list[tuple]:
+        with self._readLock:
+            return self._reader.execute(sql, params).fetchall()
+
+    def checkpoint(self, name: str) -> int:
+        rows = self._query("SELECT last_id FROM checkpoints WHERE name = ?", (name,))
+        return rows[0][0] if rows else 0
+
+    def readOutbox(self, after_id: int, limit: int = 500) -> list[tuple[int, str, object]]:
+        rows = self._query("SELECT id, path, value FROM outbox WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit))
+        return [(row_id, path, json.loads(value)) for row_id, path, value in rows]
+
+    def outboxBacklog(self, after_id: int) -> int:
+        return self._query("SELECT COUNT(*) FROM outbox WHERE id > ?", (after_id,))[0][0]
+
+    def coinTotals(self, day: str) -> dict:
+        """
+        Per-user, per-hour and day coin totals recorded for `day` (ISO date), baseline included.
+        """
+        users = dict(self._query("SELECT mac, SUM(coins) FROM coin_inserts WHERE day = ? GROUP BY mac", (day,)))
+        hours = dict(self._query("SELECT hour, SUM(coins) FROM coin_inserts WHERE day = ? GROUP BY hour", (day,)))
+        total = sum(users.values())
+
+        for kind, key, count in self._query("SELECT kind, key, coins FROM coin_baseline WHERE day = ?", (day,)):
+            if kind == 'user':
+                users[key] = users.get(key, 0) + count
+            elif kind == 'hour':
+                hours[key] = hours.get(key, 0) + count
+            else:
+                total += count
+        return {'users': users, 'hourly': hours, 'total': total}
@@ -0,0 +1,247 @@
+import logging
+import math
+import mmap
+import os
+from datetime import datetime
+
+log = logging.getLogger(__name__)
+
+_MAGIC = 0x504C5453 # "PLTS"
+_VERSION = 1
+
+# Header slots (float64 each)
+_H_MAGIC = 0
+_H_VERSION = 1
+_H_LAST_T = 2
+_H_LAST_P = 3
+_HEADER_SIZE = 4
+
+_ROLLUP_COLUMNS = ('start', 'min', 'max', 'avg', 'wh')
+
+class _Ring:
+    """
+    Fixed-capacity, column-oriented ring buffer over a float64 memoryview.
+    `state` holds [head, count] so the ring survives in a persisted buffer.
+    """
+    def __init__(self, state: memoryview, data: memoryview, capacity: int, columns: tuple[str, ...]):
+        self._state = state
+        self._capacity = capacity
+        self._columns = columns
+        self._data = [data[i * capacity:(i + 1) * capacity] for i in range(len(columns))]
+
+    def __len__(self):
+        return int(self._state[1])
+
+    def append(self, *values: float):
+        head = int(self._state[0])
+        for column, value in zip(self._data, values):
+            column[head] = value
+
+        self._state[0] = (head + 1) % self._capacity
+        self._state[1] = min(int(self._state[1]) + 1, self._capacity)
+
+    def latest(self, n: int | None = None) -> list[dict]:
+        """
+        The newest `n` rows (all by default), oldest first.
+        """
+        count = len(self)
+        n = count if n is None else min(n, count)
+        head = int(self._state[0])
+
+        rows = []
+        for offset in range(n, 0, -1):
+            index = (head - offset) % self._capacity
+            rows.append({name: column[index] for name, column in zip(self._columns, self._data)})
+        return rows
+
+class _Rollup:
+    """
+    Time-weighted aggregation of power into fixed buckets (minute, hour or day).
+    The open bucket lives in `state` as [start, min, max, watt_seconds, covered_seconds].
+    """
+    def __init__(self, name: str, size: int, utc_offset: float, state: memoryview, ring: _Ring, on_close):
+        self.name = name
+        self.size = size
+        self.ring = ring
+        self._utc_offset = utc_offset
+        self._state = state
+        self._on_close = on_close
+
+    def bucketStart(self, t: float) -> float:
+        # Buckets follow local wall-clock boundaries (local midnight for days)
+        return math.floor((t + self._utc_offset) / self.size) * self.size - self._utc_offset
+
+    def _close(self):
+        start, low, high, watt_seconds, covered = self._state
+        if covered > 0:
+            bucket = {
+                'start': start,
+                'min': low,
+                'max': high,
+                'avg': watt_seconds / covered,
+                'wh': watt_seconds / 3600,
+            }
+            self.ring.append(*(bucket[column] for column in _ROLLUP_COLUMNS))
+            if self._on_close is not None:
+                self._on_close(self.name, bucket)
+
+        self._state[3] = 0.0
+        self._state[4] = 0.0
+
+    def advance(self, t: float):
+        """
+        Close the open bucket if `t` is past its end.
+        """
+        start = self.bucketStart(t)
+        if self._state[0] != start:
+            self._close()
+            self._state[0] = start
+            self._state[1] = math.inf
+            self._state[2] = -math.inf
+
+    def accumulate(self, t0: float, p0: float, t1: float, p1: float):
+        """
+        Add a linear power segment lying inside a single bucket.
+        """
+        self.advance(t0)
+        self._state[1] = min(self._state[1], p0, p1)
+        self._state[2] = max(self._state[2], p0, p1)
+        self._state[3] += (p0 + p1) / 2 * (t1 - t0)
+        self._state[4] += t1 - t0
+
+    def current(self) -> dict | None:
+        start, low, high, watt_seconds, covered = self._state
+        if covered <= 0:
+            return None
+
+        return {'start': start, 'min': low, 'max': high, 'avg': watt_seconds / covered, 'wh': watt_seconds / 3600}
+
+class PowerSeries:
+    """
+    Constant-memory PLTS power time series.
+
+    Every sample lands in a raw ring buffer and is integrated into minute, hour and day
+    rollups (min/max/time-weighted average power and Wh) using the trapezoidal rule over the
+    real time between samples. Gaps longer than `max_gap` seconds (sensor offline) are not
+    integrated. Closed rollups are handed to `on_rollup(resolution, bucket)`.
+
+    With `path` set, all buffers live in an mmap'd file so the series, including the
+    partially filled hour and day, carries over a restart.
+    """
+    RESOLUTIONS = (
+        ('minute', 60, 24 * 60),     # one day of minutes
+        ('hour', 3600, 31 * 24),     # a month of hours
+        ('day', 86400, 366),         # a year of days
+    )
+
+    def __init__(self, path: str | None = None, raw_capacity: int = 3600, max_gap: float = 120.0, on_rollup=None):
+        self._max_gap = max_gap
+        self._on_rollup = on_rollup
+        utc_offset = datetime.now().astimezone().utcoffset().total_seconds()
+
+        size = _HEADER_SIZE + 2 + raw_capacity * 2
+        for _, _, capacity in self.RESOLUTIONS:
+            size += 2 + 5 + capacity * len(_ROLLUP_COLUMNS)
+
+        self._file = None
+        self._mmap = None
+        buffer = self._openBuffer(path, size * 8)
+        self._values = memoryview(buffer).cast('d')
+
+        if self._values[_H_MAGIC] != _MAGIC or self._values[_H_VERSION] != _VERSION:
+            for i in range(size):
+                self._values[i] = 0.0
+            self._values[_H_MAGIC] = _MAGIC
+            self._values[_H_VERSION] = _VERSION
+            self._values[_H_LAST_T] = math.nan
+
+        offset = _HEADER_SIZE
+        self.raw = _Ring(self._values[offset:offset + 2], self._values[offset + 2:offset + 2 + raw_capacity * 2],
+                         raw_capacity, ('t', 'power'))
+        offset += 2 + raw_capacity * 2
+
+        self.rollups: dict[str, _Rollup] = {}
+        for name, bucket_size, capacity in self.RESOLUTIONS:
+            ring_size = capacity * len(_ROLLUP_COLUMNS)
+            ring = _Ring(self._values[offset:offset + 2], self._values[offset + 7:offset + 7 + ring_size],
+                         capacity, _ROLLUP_COLUMNS)
+            self.rollups[name] = _Rollup(name, bucket_size, utc_offset, self._values[offset + 2:offset + 7],
+                                         ring, self._emit)
+            offset += 7 + ring_size
+
+    def _openBuffer(self, path: str | None, nbytes: int):
+        if path is None:
+            return bytearray(nbytes)
+
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self._file = open(path, 'a+b')
+            if os.path.getsize(path) != nbytes:
+                # New file or a different layout, start from an empty series
+                self._file.truncate(0)
+                self._file.truncate(nbytes)
+            self._mmap = mmap.mmap(self._file.fileno(), nbytes)
+            return self._mmap
+        except OSError as e:
+            log.warning("Cannot persist PLTS time series to %s, keeping it in memory: %s", path, e)
+            return bytearray(nbytes)
+
+    def _emit(self, resolution: str, bucket: dict):
+        if self._on_rollup is not None:
+            try:
+                self._on_rollup(resolution, bucket)
+            except Exception as e:
+                log.exception("Failed to publish %s PLTS rollup: %s", resolution, e)
+
+    # ──────────────────────────── ingestion ────────────────────────────
+    def ingest(self, t: float, voltage: float, current: float):
+        """
+        Add one sensor reading taken at unix time `t`.
+        """
+        power = max(voltage, 0.0) * max(current, 0.0)
+
+        last_t = self._values[_H_LAST_T]
+        last_p = self._values[_H_LAST_P]
+
+        if not math.isnan(last_t) and t <= last_t:
+            return # Clock went backwards or duplicate sample
+
+        if not math.isnan(last_t) and t - last_t <= self._max_gap:
+            self._integrate(last_t, last_p, t, power)
+        else:
+            for rollup in self.rollups.values():
+                rollup.advance(t)
+
+        self.raw.append(t, power)
+        self._values[_H_LAST_T] = t
+        self._values[_H_LAST_P] = power
+
+    def _integrate(self, t0: float, p0: float, t1: float, p1: float):
+        for rollup in self.rollups.values():
+            # Split the segment at bucket boundaries, interpolating the power at each cut
+            a, pa = t0, p0
+            while a < t1:
+                b = min(rollup.bucketStart(a) + rollup.size, t1)
+                pb = p0 + (p1 - p0) * (b - t0) / (t1 - t0)
+                rollup.accumulate(a, pa, b, pb)
+                a, pa = b, pb
+
+            rollup.advance(t1)
+
+    # ──────────────────────────── reads ────────────────────────────
+    def latest(self, resolution: str, n: int | None = None) -> list[dict]:
+        return self.rollups[resolution].ring.latest(n)
+
+    def current(self, resolution: str) -> dict | None:
+        """
+        The bucket still being filled for `resolution`.
+        """
+        return self.rollups[resolution].current()
+
+    def flush(self):
+        if self._mmap is not None:
+            self._mmap.flush()
+
+    def close(self):
+        # The rings keep views into the mapping for the life of the process, so only sync it to disk
+        self.flush()
@@ -0,0 +1,95 @@
+import asyncio
+import time
+
+from arduino.arduino_serial import ArduinoSerial, parseFrame
+from bench.fake_arduino import FakeArduino
+
+async def waitFor(condition, timeout: float = 3.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+def runWithArduino(test, **options):
+    """
+    Run `test(fake, arduino)` against a pty. The fake's own line thread isn't started, so only
+    what the test writes arrives.
+    """
+    async def main():
+        fake = FakeArduino()
+        arduino = ArduinoSerial(fake.path, min_backoff=0.05, max_backoff=0.1, **options)
+        await arduino.startSerial()
+        try:
+            await waitFor(lambda: arduino.ser is not None)
+            await test(fake, arduino)
+        finally:
+            await arduino.stopSerial()
+            fake.stop()
+
+    asyncio.run(main())
+
+def test_parse_frame():
+    assert parseFrame('12.50,1.200,3\n') == (12.5, 1.2, 3)
+    assert parseFrame('12.50,1.200') is None
+    assert parseFrame('12.50,x,3') is None
+    assert parseFrame('12.50,1.200,-1') is None
+
+def test_frame_split_across_reads():
+    async def test(fake, arduino):
+        fake.writeRaw(b'12.5,1.2')
+        await asyncio.sleep(0.2) # Let the reader see the first half on its own
+        fake.writeRaw(b'00,3\n')
+
+        await waitFor(lambda: arduino.framesReceived == 1)
+        assert (arduino.voltage, arduino.current, arduino.coinCount) == (12.5, 1.2, 3)
+        assert arduino.malformedFrames == 0
+
+    runWithArduino(test)
+
+def test_malformed_frames_are_counted():
+    async def test(fake, arduino):
+        fake.writeRaw(b'garbage\n12.5,1.2,-1\n13.0,1.5,2\n')
+
+        await waitFor(lambda: arduino.framesReceived == 3)
+        assert arduino.malformedFrames == 2
+        assert (arduino.voltage, arduino.coinCount) == (13.0, 2)
+
+    runWithArduino(test)
+
+def test_pending_frames_are_bounded():
+    async def test(fake, arduino):
+        fake.writeRaw(b''.join(b'13.0,1.5,%d\n' % count for count in range(1, 6)))
+        time.sleep(0.5) # Block the event loop so the reader thread can't hand frames over
+
+        await waitFor(lambda: arduino.framesReceived + arduino.droppedFrames == 5)
+        assert arduino.framesReceived == 2
+        assert arduino.droppedFrames == 3
+        assert arduino.coinCount == 2 # The oldest frames are kept, later ones dropped
+
+    runWithArduino(test, max_pending_frames=2)
+
+def test_overlong_line_is_dropped():
+    async def test(fake, arduino):
+        fake.writeRaw(b'x' * 200 + b'\n13.0,1.5,1\n')
+
+        await waitFor(lambda: arduino.coinCount == 1)
+        assert arduino.droppedFrames == 1
+
+    runWithArduino(test, max_frame_length=64)
+
+def test_reconnects_after_the_device_goes_away():
+    async def test(fake, arduino):
+        fake.stop() # Unplugged: the pty is gone
+        await waitFor(lambda: arduino.reconnects == 1 and arduino.ser is None)
+
+        # Plugged back in, enumerated under a new name
+        replacement = FakeArduino()
+        try:
+            arduino.port = replacement.path
+            await waitFor(lambda: arduino.ser is not None)
+            replacement.writeRaw(b'13.0,1.5,4\n')
+            await waitFor(lambda: arduino.coinCount == 4)
+        finally:
+            replacement.stop()
+
+    runWithArduino(test)